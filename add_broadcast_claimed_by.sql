@@ -0,0 +1,4 @@
+-- Метка пачки, в которой получатель рассылки взят на отправку
+-- Без SKIP LOCKED (SQLite) по ней процесс перечитывает, какие строки
+-- пачки достались именно ему
+ALTER TABLE broadcast_deliveries ADD COLUMN IF NOT EXISTS claimed_by VARCHAR(32);
@@ -0,0 +1,8 @@
+-- Индекс по картинкам постов (PostgreSQL)
+-- Одинаковые картинки хранятся одним файлом, и перед удалением файла
+-- проверяется, не использует ли его другой пост.
+-- На живой базе можно добавить CONCURRENTLY (вне транзакции).
+
+CREATE INDEX IF NOT EXISTS ix_posts_image_id ON posts (image_id);
+
+ANALYZE posts;
@@ -0,0 +1,38 @@
+-- Вторичные индексы под запросы репозиториев (PostgreSQL)
+-- Новые базы получают их через create_all, этот файл — для существующих.
+-- На живой базе можно добавить CONCURRENTLY (вне транзакции).
+
+-- 1. Посты: просроченные, посты автора
+CREATE INDEX IF NOT EXISTS ix_posts_event_at ON posts (event_at);
+CREATE INDEX IF NOT EXISTS ix_posts_author_id ON posts (author_id);
+
+-- 2. Частичные индексы: опубликованные посты по дате события и очередь модерации
+-- (условие "не просрочен" зависит от now() и не может входить в предикат индекса)
+CREATE INDEX IF NOT EXISTS ix_posts_published_event_at ON posts (event_at, id)
+    WHERE is_approved AND is_published;
+CREATE INDEX IF NOT EXISTS ix_posts_pending_moderation ON posts (id)
+    WHERE NOT is_approved AND NOT is_published;
+
+-- 3. Обратный поиск по связям многие-ко-многим
+CREATE INDEX IF NOT EXISTS ix_post_categories_category_id ON post_categories (category_id, post_id);
+CREATE INDEX IF NOT EXISTS ix_post_cities_city_id ON post_cities (city_id, post_id);
+CREATE INDEX IF NOT EXISTS ix_user_categories_category_id ON user_categories (category_id, user_id);
+CREATE INDEX IF NOT EXISTS ix_user_cities_city_id ON user_cities (city_id, user_id);
+
+-- 4. Лайки и модерация
+CREATE INDEX IF NOT EXISTS ix_likes_post_id ON likes (post_id);
+CREATE INDEX IF NOT EXISTS ix_moderation_records_post_id ON moderation_records (post_id);
+CREATE INDEX IF NOT EXISTS ix_moderation_records_moderator_id ON moderation_records (moderator_id);
+
+-- 5. Материализованная лента
+CREATE INDEX IF NOT EXISTS ix_user_feed_post_id ON user_feed (post_id);
+
+-- 6. Обновляем статистику планировщика
+ANALYZE posts;
+ANALYZE post_categories;
+ANALYZE post_cities;
+ANALYZE user_categories;
+ANALYZE user_cities;
+ANALYZE likes;
+ANALYZE moderation_records;
+ANALYZE user_feed;
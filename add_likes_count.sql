@@ -0,0 +1,11 @@
+-- Денормализованный счетчик лайков у постов
+-- 1. Добавляем поле
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS likes_count INTEGER NOT NULL DEFAULT 0;
+
+-- 2. Заполняем по текущим лайкам
+UPDATE posts SET likes_count = (
+    SELECT COUNT(*) FROM likes WHERE likes.post_id = posts.id
+);
+
+-- 3. Проверяем результат
+SELECT id, title, likes_count FROM posts WHERE likes_count > 0 ORDER BY likes_count DESC LIMIT 20;
@@ -0,0 +1,4 @@
+-- file_id фото поста в Telegram
+-- Заполняется при загрузке фото или после первой отправки поста с фото,
+-- дальше фото отправляется по file_id без обращения к хранилищу
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS tg_file_id VARCHAR(255);
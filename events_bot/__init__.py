@@ -10,6 +10,10 @@ from .database import (
     create_async_engine_and_session,
     create_tables,
     get_db,
+    init_engine,
+    get_engine,
+    get_session_maker,
+    dispose_engine,
     # Repositories
     UserRepository,
     CategoryRepository,
@@ -32,6 +36,10 @@ __all__ = [
     "create_async_engine_and_session",
     "create_tables",
     "get_db",
+    "init_engine",
+    "get_engine",
+    "get_session_maker",
+    "dispose_engine",
     # Repositories
     "UserRepository",
     "CategoryRepository",
@@ -0,0 +1,112 @@
+"""
+Сборка диспетчера и фоновые задачи бота
+
+Используется и в однопроцессном режиме, и в каждом воркере
+многопроцессного режима (см. sharding).
+"""
+
+import asyncio
+import os
+from datetime import datetime, timezone
+from typing import Optional
+
+import logfire
+from aiogram import Bot, Dispatcher
+from aiogram.fsm.storage.base import BaseStorage
+
+from .handlers import (
+    register_start_handlers,
+    register_user_handlers,
+    register_post_handlers,
+    register_callback_handlers,
+    register_moderation_handlers,
+    register_feed_handlers,
+)
+from .middleware import DatabaseMiddleware
+from .fsm_storage import SQLStorage
+from .utils import get_db_session
+from ..database.services.post_service import PostService
+from ..database.services.like_service import LikeService
+from ..database.services.broadcast_service import BroadcastService
+
+
+def create_dispatcher(storage: Optional[BaseStorage] = None) -> Dispatcher:
+    """Диспетчер со всеми обработчиками и middleware"""
+    dp = Dispatcher(storage=storage) if storage else Dispatcher()
+
+    # Подключаем middleware для базы данных
+    dp.message.middleware(DatabaseMiddleware())
+    dp.callback_query.middleware(DatabaseMiddleware())
+
+    # Регистрируем обработчики
+    register_start_handlers(dp)
+    register_user_handlers(dp)
+    register_post_handlers(dp)
+    register_callback_handlers(dp)
+    register_moderation_handlers(dp)
+    register_feed_handlers(dp)
+    return dp
+
+
+async def cleanup_expired_posts_task() -> None:
+    # Спим до ближайшего event_at, но не дольше CLEANUP_MAX_INTERVAL:
+    # так замечаются и посты, созданные во время сна
+    max_interval = float(os.getenv("CLEANUP_MAX_INTERVAL", "600"))
+    while True:
+        delay = max_interval
+        try:
+            async with get_db_session() as db:
+                deleted = await PostService.delete_expired_posts(db)
+                if deleted:
+                    logfire.info(f"🧹 Удалено просроченных постов: {deleted}")
+                purged = await PostService.purge_pending_images(db)
+                if purged:
+                    logfire.info(f"🧹 Удалено брошенных загрузок картинок: {purged}")
+                next_event_at = await PostService.get_next_event_at(db)
+            if next_event_at:
+                now = datetime.now(timezone.utc).replace(tzinfo=None)
+                delay = min(max_interval, max(1.0, (next_event_at - now).total_seconds()))
+        except Exception as e:
+            logfire.error(f"Ошибка фоновой очистки постов: {e}")
+        await asyncio.sleep(delay)
+
+
+async def reconcile_likes_count_task() -> None:
+    interval = int(os.getenv("LIKES_RECONCILE_INTERVAL", "3600"))
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with get_db_session() as db:
+                fixed = await LikeService.reconcile_likes_count(db)
+                if fixed:
+                    logfire.warning(f"❤️ Исправлены счетчики лайков у постов: {fixed}")
+        except Exception as e:
+            logfire.error(f"Ошибка сверки счетчиков лайков: {e}")
+
+
+async def purge_fsm_states_task(storage: BaseStorage) -> None:
+    # Redis удаляет ключи по TTL сам, таблицу fsm_states чистим вручную
+    if not isinstance(storage, SQLStorage):
+        return
+    interval = int(os.getenv("FSM_PURGE_INTERVAL", "3600"))
+    while True:
+        try:
+            purged = await storage.purge_expired()
+            if purged:
+                logfire.info(f"🧹 Удалено брошенных состояний FSM: {purged}")
+        except Exception as e:
+            logfire.error(f"Ошибка очистки состояний FSM: {e}")
+        await asyncio.sleep(interval)
+
+
+async def run_background_tasks(bot: Bot, storage: BaseStorage) -> None:
+    """Периодические задачи и диспетчер рассылок
+
+    Должны работать ровно в одном процессе бота.
+    """
+    await asyncio.gather(
+        cleanup_expired_posts_task(),
+        reconcile_likes_count_task(),
+        purge_fsm_states_task(storage),
+        BroadcastService.run_dispatcher(bot),
+    )
@@ -0,0 +1,238 @@
+"""
+Хранилища состояний FSM
+
+FSM_STORAGE выбирает хранилище:
+- sql — таблица fsm_states в основной базе (по умолчанию);
+- redis — aiogram RedisStorage по REDIS_URL (нужен пакет redis);
+- memory — MemoryStorage в памяти процесса, для локального запуска.
+
+Черновики, не менявшиеся дольше FSM_STATE_TTL секунд, считаются брошенными.
+
+aiogram читает состояние на каждое обновление, поэтому SQLStorage держит
+последние FSM_CACHE_SIZE прочитанных состояний в памяти процесса. Кэш
+верен, пока все обновления чата обрабатывает один процесс (один процесс
+бота или BOT_WORKERS с раскладкой по чатам). Несколько независимых реплик
+webhook должны отключить его (FSM_CACHE_SIZE=0) или взять redis.
+"""
+
+import json
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+import logfire
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import (
+    BaseStorage,
+    DefaultKeyBuilder,
+    KeyBuilder,
+    StateType,
+    StorageKey,
+)
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import case, delete, insert, null, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..database.connection import get_session_maker
+from ..database.models import FSMRecord, utc_now
+
+# Время жизни неактивного состояния FSM, секунды
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", str(60 * 60 * 24 * 3)))
+# Сколько состояний SQLStorage держит в памяти процесса (0 — без кэша)
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "10000"))
+
+# Число счетчиков записей для кэша: ключ попадает в счетчик по хэшу
+_GENERATION_BUCKETS = 256
+
+# Строка fsm_states в кэше: (state, data, updated_at); (None, None, None) — строки нет
+_CachedRecord = Tuple[Optional[str], Optional[str], Optional[datetime]]
+
+
+class SQLStorage(BaseStorage):
+    """Хранилище FSM в таблице fsm_states
+
+    Состояние и данные одного ключа лежат в одной строке, каждая запись —
+    один UPSERT. Просроченные строки не читаются и удаляются purge_expired.
+    Прочитанные строки кэшируются в памяти (см. описание модуля), запись
+    удаляет строку из кэша.
+    """
+
+    def __init__(
+        self,
+        ttl: Optional[int] = FSM_STATE_TTL,
+        key_builder: Optional[KeyBuilder] = None,
+        cache_size: int = FSM_CACHE_SIZE,
+    ):
+        self.ttl = ttl
+        self.key_builder = key_builder or DefaultKeyBuilder(
+            with_bot_id=True, with_destiny=True
+        )
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, _CachedRecord]" = OrderedDict()
+        # Счетчики записей: чтение, во время которого ключ записывали,
+        # не попадает в кэш
+        self._generations = [0] * _GENERATION_BUCKETS
+
+    def _expired_at(self):
+        return utc_now() - timedelta(seconds=self.ttl)
+
+    def _bump(self, record_key: str) -> None:
+        self._generations[hash(record_key) % _GENERATION_BUCKETS] += 1
+        self._cache.pop(record_key, None)
+
+    async def _upsert(
+        self, db: AsyncSession, key: str, column: str, value: Optional[str]
+    ) -> None:
+        """INSERT строки состояния или UPDATE одного поля
+
+        Второе поле просроченной строки сбрасывается, чтобы брошенный
+        черновик не ожил при следующей записи.
+        """
+        other = "data" if column == "state" else "state"
+        reset_other = None
+        if self.ttl:
+            reset_other = case(
+                (FSMRecord.updated_at < self._expired_at(), null()),
+                else_=getattr(FSMRecord, other),
+            )
+        now = utc_now()
+        values = {column: value, "updated_at": now}
+
+        dialect = db.get_bind().dialect.name
+        if dialect in ("postgresql", "sqlite"):
+            if dialect == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            updates = dict(values)
+            if reset_other is not None:
+                updates[other] = reset_other
+            await db.execute(
+                dialect_insert(FSMRecord)
+                .values(key=key, **values)
+                .on_conflict_do_update(index_elements=["key"], set_=updates)
+            )
+            return
+
+        # Другие диалекты: UPDATE, а если строки нет — INSERT. Второе поле
+        # присваивается первым: MySQL вычисляет SET слева направо и иначе
+        # увидел бы уже новый updated_at
+        assignments = [(getattr(FSMRecord, name), v) for name, v in values.items()]
+        if reset_other is not None:
+            assignments.insert(0, (getattr(FSMRecord, other), reset_other))
+        stmt = update(FSMRecord).where(FSMRecord.key == key).ordered_values(*assignments)
+        if (await db.execute(stmt)).rowcount:
+            return
+        try:
+            async with db.begin_nested():
+                await db.execute(insert(FSMRecord).values(key=key, **values))
+        except IntegrityError:
+            # Строку только что вставил параллельный запрос
+            await db.execute(stmt)
+
+    async def _write(self, key: StorageKey, column: str, value: Optional[str]) -> None:
+        record_key = self.key_builder.build(key)
+        self._bump(record_key)
+        try:
+            async with get_session_maker()() as db:
+                await self._upsert(db, record_key, column, value)
+                if value is None:
+                    # Пустое состояние без данных хранить незачем
+                    await db.execute(
+                        delete(FSMRecord).where(
+                            FSMRecord.key == record_key,
+                            FSMRecord.state.is_(None),
+                            FSMRecord.data.is_(None),
+                        )
+                    )
+                await db.commit()
+        finally:
+            self._bump(record_key)
+
+    async def _read_record(self, key: StorageKey) -> _CachedRecord:
+        record_key = self.key_builder.build(key)
+        record = self._cache.get(record_key)
+        if record is None:
+            bucket = hash(record_key) % _GENERATION_BUCKETS
+            generation = self._generations[bucket]
+            async with get_session_maker()() as db:
+                row = (
+                    await db.execute(
+                        select(
+                            FSMRecord.state, FSMRecord.data, FSMRecord.updated_at
+                        ).where(FSMRecord.key == record_key)
+                    )
+                ).first()
+            record = tuple(row) if row else (None, None, None)
+            if self.cache_size > 0 and self._generations[bucket] == generation:
+                self._cache[record_key] = record
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(record_key)
+        state, data, updated_at = record
+        if self.ttl and updated_at is not None and updated_at < self._expired_at():
+            return None, None, None
+        return record
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        if isinstance(state, State):
+            state = state.state
+        await self._write(key, "state", state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _, _ = await self._read_record(key)
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await self._write(key, "data", json.dumps(dict(data)) if data else None)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data, _ = await self._read_record(key)
+        return json.loads(data) if data else {}
+
+    async def purge_expired(self) -> int:
+        """Удалить брошенные состояния; возвращает количество удаленных"""
+        if not self.ttl:
+            return 0
+        async with get_session_maker()() as db:
+            result = await db.execute(
+                delete(FSMRecord).where(FSMRecord.updated_at < self._expired_at())
+            )
+            await db.commit()
+        # Просроченные строки в кэше и так не отдаются
+        return result.rowcount or 0
+
+    async def close(self) -> None:
+        # Соединения принадлежат общему пулу и закрываются вместе с движком
+        pass
+
+
+def get_fsm_storage() -> BaseStorage:
+    """Создать хранилище FSM по переменной FSM_STORAGE"""
+    kind = os.getenv("FSM_STORAGE", "sql").lower()
+    if kind == "memory":
+        logfire.warning(
+            "Состояния FSM хранятся в памяти: они теряются при перезапуске, "
+            "несколько процессов бота запускать нельзя"
+        )
+        return MemoryStorage()
+    if kind == "redis":
+        try:
+            from aiogram.fsm.storage.redis import RedisStorage
+        except ImportError as e:
+            raise RuntimeError(
+                "Для FSM_STORAGE=redis установите пакет redis"
+            ) from e
+        ttl = FSM_STATE_TTL or None
+        return RedisStorage.from_url(
+            os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+            key_builder=DefaultKeyBuilder(with_bot_id=True, with_destiny=True),
+            state_ttl=ttl,
+            data_ttl=ttl,
+        )
+    if kind == "sql":
+        return SQLStorage()
+    raise ValueError(f"Неизвестное хранилище FSM_STORAGE={kind}")
@@ -10,7 +10,6 @@ from events_bot.bot.keyboards.feed_keyboard import (
     get_liked_list_keyboard,
     get_liked_post_keyboard,
 )
-from events_bot.storage import file_storage
 import logfire
 from datetime import timezone
 from events_bot.utils import get_clean_category_string
@@ -101,6 +100,11 @@ async def show_liked(callback: CallbackQuery, db):
     await callback.answer()
 
 
+def _parse_cursor(data: list[str], index: int) -> str | None:
+    """Курсор из callback_data (у старых кнопок его нет)"""
+    return data[index] if len(data) > index and data[index] else None
+
+
 @router.callback_query(F.data.startswith("feed_"))
 async def handle_feed_navigation(callback: CallbackQuery, db):
     data = callback.data.split("_")
@@ -109,18 +113,27 @@ async def handle_feed_navigation(callback: CallbackQuery, db):
         if action in ["prev", "next"]:
             current_page = int(data[2])
             total_pages = int(data[3])
+            cursor = _parse_cursor(data, 4)
             new_page = (
                 max(0, current_page - 1) if action == "prev" else current_page + 1
             )
-            await show_feed_page_from_animation(callback.message, new_page, db, user_id=callback.from_user.id)
+            await show_feed_page_from_animation(
+                callback.message, new_page if cursor else 0, db,
+                user_id=callback.from_user.id, cursor=cursor, direction=action,
+            )
         elif action == "open":
             post_id = int(data[2])
             current_page = int(data[3])
             total_pages = int(data[4])
-            await show_post_details(callback, post_id, current_page, total_pages, db)
+            cursor = _parse_cursor(data, 5) or ""
+            await show_post_details(callback, post_id, current_page, total_pages, db, cursor)
         elif action == "back":
             current_page = int(data[2])
-            await show_feed_page_from_animation(callback.message, current_page, db, user_id=callback.from_user.id)
+            cursor = _parse_cursor(data, 4)
+            await show_feed_page_from_animation(
+                callback.message, current_page if cursor else 0, db,
+                user_id=callback.from_user.id, cursor=cursor, direction="at",
+            )
         elif action == "heart":
             post_id = int(data[2])
             current_page = int(data[3])
@@ -131,14 +144,25 @@ async def handle_feed_navigation(callback: CallbackQuery, db):
     await callback.answer()
 
 
-async def show_feed_page_from_animation(message: Message, page: int, db, user_id: int):
+async def show_feed_page_from_animation(
+    message: Message,
+    page: int,
+    db,
+    user_id: int,
+    cursor: str | None = None,
+    direction: str = "next",
+):
     try:
         await message.delete()
     except Exception as e:
         logfire.warning(f"Не удалось удалить сообщение: {e}")
 
     try:
-        posts = await PostService.get_feed_posts(db, user_id, POSTS_PER_PAGE, page * POSTS_PER_PAGE)
+        posts, total_posts = await PostService.get_feed_page(db, user_id, POSTS_PER_PAGE, cursor, direction)
+        # Лента изменилась с момента построения кнопок — начинаем с первой страницы
+        if cursor and (not posts or (direction == "prev" and len(posts) < POSTS_PER_PAGE)):
+            page = 0
+            posts, total_posts = await PostService.get_feed_page(db, user_id, POSTS_PER_PAGE)
         if not posts:
             await message.answer_animation(
                 animation=FEED_GIF_ID,
@@ -152,10 +176,7 @@ async def show_feed_page_from_animation(message: Message, page: int, db, user_id
             )
             return
 
-        total_posts = await PostService.get_feed_posts_count(db, user_id)
         total_pages = (total_posts + POSTS_PER_PAGE - 1) // POSTS_PER_PAGE
-        for post in posts:
-            await db.refresh(post, attribute_names=["categories"])
         preview_text = format_feed_list(posts, page * POSTS_PER_PAGE + 1, total_posts, current_page=page)
         start_index = page * POSTS_PER_PAGE + 1
 
@@ -169,14 +190,25 @@ async def show_feed_page_from_animation(message: Message, page: int, db, user_id
         logfire.error(f"Ошибка при отправке ленты с гифкой: {e}")
 
 
-async def show_liked_page_from_animation(message: Message, page: int, db, user_id: int):
+async def show_liked_page_from_animation(
+    message: Message,
+    page: int,
+    db,
+    user_id: int,
+    cursor: str | None = None,
+    direction: str = "next",
+):
     try:
         await message.delete()
     except Exception as e:
         logfire.warning(f"Не удалось удалить сообщение: {e}")
 
     try:
-        posts = await PostService.get_liked_posts(db, user_id, POSTS_PER_PAGE, page * POSTS_PER_PAGE)
+        posts, total_posts = await PostService.get_liked_page(db, user_id, POSTS_PER_PAGE, cursor, direction)
+        # Избранное изменилось с момента построения кнопок — начинаем с первой страницы
+        if cursor and (not posts or (direction == "prev" and len(posts) < POSTS_PER_PAGE)):
+            page = 0
+            posts, total_posts = await PostService.get_liked_page(db, user_id, POSTS_PER_PAGE)
         if not posts:
             await message.answer_animation(
                 animation=LIKED_GIF_ID,
@@ -190,7 +222,6 @@ async def show_liked_page_from_animation(message: Message, page: int, db, user_i
             )
             return
 
-        total_posts = await PostService.get_liked_posts_count(db, user_id)
         total_pages = (total_posts + POSTS_PER_PAGE - 1) // POSTS_PER_PAGE
         start_index = page * POSTS_PER_PAGE + 1
         text = format_liked_list(posts, start_index, total_posts, current_page=page)
@@ -237,9 +268,6 @@ def format_feed_list(posts, current_position_start: int, total_posts: int, curre
         event_at = getattr(post, "event_at", None)
         event_str = event_at.strftime("%d.%m.%Y %H:%M") if event_at else ""
         
-        city_names = [c.name for c in getattr(post, "cities", [])]
-        post_city = ", ".join(city_names) or "Не указан"
-        
         lines.append(f"{idx}. <b>{post.title}</b>")
         lines.append(f"<i>   ⭐️ {category_str}</i>")
         lines.append(f"<i>   🗓 {event_str}</i>")
@@ -264,8 +292,6 @@ def format_liked_list(posts, current_position_start: int, total_posts: int, curr
         category_str = get_clean_category_string(post.categories)
         event_at = getattr(post, "event_at", None)
         event_str = event_at.strftime("%d.%m.%Y %H:%M") if event_at else ""
-        city_names = [c.name for c in getattr(post, "cities", [])]
-        post_city = ", ".join(city_names) or "Не указан"
         
         lines.append(f"{idx}. <b>{post.title}</b>")
         lines.append(f"<i>   ⭐️ {category_str}</i>")
@@ -291,16 +317,17 @@ async def handle_post_heart(callback: CallbackQuery, post_id: int, db, data):
         action_text = "добавлено" if result["action"] == "added" else "удалено"
         await callback.answer(f"Избранное {action_text}", show_alert=True)
 
-        is_liked = await LikeService.is_post_liked_by_user(db, callback.from_user.id, post_id)
+        is_liked = result["is_liked"]
         current_page, total_pages = int(data[3]), int(data[4])
+        cursor = _parse_cursor(data, 5) or ""
         section = data[0]
 
         post = await PostService.get_post_by_id(db, post_id)
         post_url = getattr(post, "url", None)
 
         keyboard_map = {
-            "liked": get_liked_post_keyboard(current_page, total_pages, post_id, is_liked),
-            "feed": get_feed_post_keyboard(current_page, total_pages, post_id, is_liked, post_url)
+            "liked": get_liked_post_keyboard(current_page, total_pages, post_id, is_liked, post_url, cursor),
+            "feed": get_feed_post_keyboard(current_page, total_pages, post_id, is_liked, post_url, cursor)
         }
         await callback.message.edit_reply_markup(reply_markup=keyboard_map.get(section))
 
@@ -310,14 +337,13 @@ async def handle_post_heart(callback: CallbackQuery, post_id: int, db, data):
 
 
 async def show_post_details(
-    callback: CallbackQuery, post_id: int, current_page: int, total_pages: int, db
+    callback: CallbackQuery, post_id: int, current_page: int, total_pages: int, db, cursor: str = ""
 ):
     post = await PostService.get_post_by_id(db, post_id)
     if not post:
         await callback.answer("Пост не найден", show_alert=True)
         return
-        
-    await db.refresh(post, attribute_names=["author", "categories", "cities"])
+
     is_liked = await LikeService.is_post_liked_by_user(db, callback.from_user.id, post.id)
     text = format_post_for_feed(post)
     post_url = getattr(post, "url", None)
@@ -326,7 +352,8 @@ async def show_post_details(
         total_pages=total_pages,
         post_id=post.id,
         is_liked=is_liked,
-        url=post_url
+        url=post_url,
+        cursor=cursor,
     )
 
     try:
@@ -335,13 +362,14 @@ async def show_post_details(
         logfire.warning(f"Не удалось удалить сообщение при показе деталей: {e}")
 
     try:
-        if post.image_id and (media_photo := await file_storage.get_media_photo(post.image_id)):
-            await callback.message.answer_photo(
-                photo=media_photo.media,
+        if photo := await PostService.get_post_photo(post):
+            sent = await callback.message.answer_photo(
+                photo=photo,
                 caption=text,
                 parse_mode="HTML",
                 reply_markup=keyboard
             )
+            await PostService.remember_tg_file_id(post, sent, db)
         else:
             await callback.message.answer(
                 text=text,
@@ -360,14 +388,23 @@ async def handle_liked_navigation(callback: CallbackQuery, db):
     try:
         if action in ["prev", "next"]:
             current_page, total_pages = int(data[2]), int(data[3])
+            cursor = _parse_cursor(data, 4)
             new_page = max(0, current_page - 1) if action == "prev" else current_page + 1
-            await show_liked_page_from_animation(callback.message, new_page, db, user_id=callback.from_user.id)
+            await show_liked_page_from_animation(
+                callback.message, new_page if cursor else 0, db,
+                user_id=callback.from_user.id, cursor=cursor, direction=action,
+            )
         elif action == "open":
             post_id, current_page, total_pages = int(data[2]), int(data[3]), int(data[4])
-            await show_liked_post_details(callback, post_id, current_page, total_pages, db)
+            cursor = _parse_cursor(data, 5) or ""
+            await show_liked_post_details(callback, post_id, current_page, total_pages, db, cursor)
         elif action == "back":
             current_page = int(data[2])
-            await show_liked_page_from_animation(callback.message, current_page, db, user_id=callback.from_user.id)
+            cursor = _parse_cursor(data, 4)
+            await show_liked_page_from_animation(
+                callback.message, current_page if cursor else 0, db,
+                user_id=callback.from_user.id, cursor=cursor, direction="at",
+            )
         elif action == "heart":
             post_id = int(data[2])
             await handle_post_heart(callback, post_id, db, data)
@@ -377,14 +414,13 @@ async def handle_liked_navigation(callback: CallbackQuery, db):
 
 
 async def show_liked_post_details(
-    callback: CallbackQuery, post_id: int, current_page: int, total_pages: int, db
+    callback: CallbackQuery, post_id: int, current_page: int, total_pages: int, db, cursor: str = ""
 ):
     post = await PostService.get_post_by_id(db, post_id)
     if not post:
         await callback.answer("Мероприятие не найдено", show_alert=True)
         return
 
-    await db.refresh(post, attribute_names=["author", "categories", "cities"])
     is_liked = await LikeService.is_post_liked_by_user(db, callback.from_user.id, post.id)
     text = format_post_for_feed(post)
     
@@ -397,7 +433,8 @@ async def show_liked_post_details(
         total_pages=total_pages,
         post_id=post.id,
         is_liked=is_liked,
-        url=post_url  # ← Ключевое исправление
+        url=post_url,  # ← Ключевое исправление
+        cursor=cursor,
     )
 
     try:
@@ -406,13 +443,14 @@ async def show_liked_post_details(
         logfire.warning(f"Не удалось удалить сообщение при показе деталей избранного: {e}")
 
     try:
-        if post.image_id and (media_photo := await file_storage.get_media_photo(post.image_id)):
-            await callback.message.answer_photo(
-                photo=media_photo.media,
+        if photo := await PostService.get_post_photo(post):
+            sent = await callback.message.answer_photo(
+                photo=photo,
                 caption=text,
                 parse_mode="HTML",
                 reply_markup=keyboard
             )
+            await PostService.remember_tg_file_id(post, sent, db)
         else:
             await callback.message.answer(
                 text=text,
@@ -15,6 +15,7 @@ from events_bot.bot.keyboards import (
     get_main_keyboard,
 )
 from events_bot.bot.states.moderation_states import ModerationStates
+from events_bot.utils import run_in_background
 
 router = Router()
 
@@ -139,24 +140,16 @@ async def process_moderation_action(callback: CallbackQuery, state: FSMContext,
         post = await PostService.approve_post(db, post_id, callback.from_user.id)
         if post:
             post = await PostService.publish_post(db, post_id)
-            await db.refresh(post, attribute_names=["author", "categories", "cities"])
             logfire.info(f"Пост {post_id} одобрен и опубликован модератором {callback.from_user.id}")
-            
-            users_to_notify = await NotificationService.get_users_to_notify(db, post)
-            logfire.info(f"Отправляем уведомления {len(users_to_notify)} пользователям")
-            await NotificationService.send_post_notification(
-                bot=callback.bot, post=post, users=users_to_notify, db=db
+
+            # Уведомления рассылаются в фоне, прогресс приходит в группу модерации
+            run_in_background(
+                NotificationService.notify_post_subscribers(
+                    callback.bot, post.id, report_chat_id=callback.message.chat.id
+                ),
+                name=f"notify_post_{post.id}",
             )
-            
-            # Отправляем сообщение с информацией о количестве уведомленных пользователей
-            try:
-                await callback.bot.send_message(
-                    chat_id=callback.message.chat.id,  # Отправляем в ту же группу модерации
-                    text=f"✅ Пост одобрен и опубликован. Уведомления отправлены {len(users_to_notify)} пользователям."
-                )
-            except Exception as e:
-                logfire.warning(f"Не удалось отправить сообщение о количестве уведомленных: {e}")
-            
+
             try:
                 await callback.bot.send_message(
                     chat_id=post.author_id,
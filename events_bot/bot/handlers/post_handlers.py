@@ -12,11 +12,12 @@ from events_bot.bot.keyboards import (
     get_category_selection_keyboard,
     get_city_keyboard,
 )
-from events_bot.storage import file_storage
+from events_bot.storage.images import save_image, IMAGE_SPOOL_SIZE
 from loguru import logger
 from datetime import timezone
 from events_bot.bot.handlers.start_handler import MAIN_MENU_GIF_IDS
 import random
+import tempfile
 
 router = Router()
 
@@ -40,8 +41,8 @@ async def cmd_create_post(message: Message, state: FSMContext, db):
     await state.set_state(PostStates.waiting_for_city_selection)
 
 
-@router.message(F.text == "/cancel")
-async def cmd_cancel_post(message: Message, state: FSMContext, db):
+@router.message(F.text == "/cancel", flags={"db": False})
+async def cmd_cancel_post(message: Message, state: FSMContext):
     """Отмена создания поста на любом этапе"""
     logfire.info(f"Пользователь {message.from_user.id} отменил создание поста")
     await state.clear()
@@ -70,8 +71,8 @@ async def start_create_post(callback: CallbackQuery, state: FSMContext, db):
     await callback.answer()
 
 
-@router.callback_query(F.data == "cancel_post")
-async def cancel_post_creation(callback: CallbackQuery, state: FSMContext, db):
+@router.callback_query(F.data == "cancel_post", flags={"db": False})
+async def cancel_post_creation(callback: CallbackQuery, state: FSMContext):
     """Отмена создания поста — с возвратом через гифку главного меню"""
     await state.clear()
 
@@ -376,10 +377,13 @@ async def process_post_image(message: Message, state: FSMContext, db):
 
     photo = message.photo[-1]
     file_info = await message.bot.get_file(photo.file_id)
-    file_data = await message.bot.download_file(file_info.file_path)
-    file_id = await file_storage.save_file(file_data.read(), "jpg")
+    # Скачиваем потоком: крупный файл уходит из памяти во временный файл
+    with tempfile.SpooledTemporaryFile(max_size=IMAGE_SPOOL_SIZE) as buffer:
+        await message.bot.download_file(file_info.file_path, destination=buffer)
+        file_id = await save_image(buffer)
 
-    await state.update_data(image_id=file_id)
+    # file_id Telegram сохраняем сразу: по нему фото переотправляется без хранилища
+    await state.update_data(image_id=file_id, tg_file_id=photo.file_id)
     await continue_post_creation(message, state, db)
 
 
@@ -402,6 +406,7 @@ async def continue_post_creation(callback_or_message: Union[Message, CallbackQue
     category_ids = data.get("category_ids", [])
     post_city_names = data.get("post_city_names", [])
     image_id = data.get("image_id")
+    tg_file_id = data.get("tg_file_id")
     event_at_iso = data.get("event_at")
     url = data.get("url")
     address = data.get("address")
@@ -426,6 +431,7 @@ async def continue_post_creation(callback_or_message: Union[Message, CallbackQue
         url=url,
         address=address,
         bot=message.bot,
+        tg_file_id=tg_file_id,
     )
 
     if post:
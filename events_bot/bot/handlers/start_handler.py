@@ -150,13 +150,13 @@ async def show_main_menu(message: Message):
     )
 
 
-@router.message(F.text.in_(["/menu", "/main_menu"]))
+@router.message(F.text.in_(["/menu", "/main_menu"]), flags={"db": False})
 async def cmd_main_menu(message: Message):
     """Обработчик команды /menu"""
     await show_main_menu(message)
 
 
-@router.callback_query(F.data == "main_menu")
+@router.callback_query(F.data == "main_menu", flags={"db": False})
 async def callback_main_menu(callback: CallbackQuery):
     """Обработчик кнопки «🏠 Главное меню»"""
     try:
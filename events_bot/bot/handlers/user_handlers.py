@@ -1,7 +1,7 @@
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
-from events_bot.database.services import UserService, CategoryService, PostService, LikeService, CityService
+from events_bot.database.services import UserService, CategoryService, PostService, LikeService, CityService, BroadcastService
 from events_bot.bot.states import UserStates
 from events_bot.bot.keyboards import get_main_keyboard, get_category_selection_keyboard, get_city_keyboard
 from events_bot.utils import get_clean_category_string
@@ -10,8 +10,6 @@ from events_bot.bot.handlers.feed_handlers import show_liked_page_from_animation
 from events_bot.bot.keyboards.feed_keyboard import get_liked_list_keyboard
 import logfire
 import os
-import asyncio
-from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
 
 LIKED_GIF_ID = os.getenv("LIKED_GIF_ID")
 POSTS_PER_PAGE = 5
@@ -137,7 +135,7 @@ async def handle_notify_heart(callback: CallbackQuery, db):
         user_id = callback.from_user.id
 
         result = await LikeService.toggle_like(db, user_id, post_id)
-        is_liked = result["action"] == "added"
+        is_liked = result["is_liked"]
         post = await PostService.get_post_by_id(db, post_id)
         post_url = getattr(post, "url", None)
 
@@ -193,71 +191,21 @@ async def cmd_broadcast(message: Message, db):
     # Используем HTML-разметку для выделения жирным
     broadcast_text = f"<b>Команда «Сердца»:</b>\n\n{original_text}"
 
-    # Подтверждение отправки
-    confirm_msg = await message.answer(f"⏳ Начинаю рассылку сообщения...\n\n{broadcast_text}", parse_mode="HTML")
-    
-    # Получаем всех пользователей из базы данных
-    users = await UserService.get_all_users(db)
-    
-    if not users:
-        await confirm_msg.edit_text("❌ Нет пользователей для отправки сообщения.")
-        return
+    # Подтверждение: это сообщение диспетчер будет обновлять прогрессом
+    confirm_msg = await message.answer(f"⏳ Рассылка поставлена в очередь...\n\n{broadcast_text}", parse_mode="HTML")
 
-    total_users = len(users)
-    success_count = 0
-    fail_count = 0
-    
-    # Отправляем сообщение каждому пользователю
-    for user in users:
-        try:
-            # Отправляем сообщение с HTML-разметкой
-            await message.bot.send_message(chat_id=user.id, text=broadcast_text, parse_mode="HTML")
-            success_count += 1
-            # Небольшая задержка, чтобы избежать ограничений Telegram
-            await asyncio.sleep(0.05) 
-        except TelegramForbiddenError:
-            # Пользователь заблокировал бота
-            logfire.warning(f"Пользователь {user.id} заблокировал бота, не могу отправить сообщение")
-            fail_count += 1
-        except TelegramRetryAfter as e:
-            # Достигнут лимит запросов, ждем
-            logfire.warning(f"Достигнут лимит запросов Telegram, жду {e.retry_after} секунд")
-            await asyncio.sleep(e.retry_after)
-            # Повторяем попытку для этого пользователя
-            try:
-                await message.bot.send_message(chat_id=user.id, text=broadcast_text, parse_mode="HTML")
-                success_count += 1
-            except Exception as e2:
-                logfire.error(f"Ошибка повторной отправки сообщения пользователю {user.id}: {e2}")
-                fail_count += 1
-        except Exception as e:
-            logfire.error(f"Ошибка отправки сообщения пользователю {user.id}: {e}")
-            fail_count += 1
-            
-        # Обновляем статус каждые 10 пользователей
-        if (success_count + fail_count) % 10 == 0 or (success_count + fail_count) == total_users:
-            try:
-                await confirm_msg.edit_text(
-                    f"⏳ Рассылка сообщения...\n"
-                    f"Прогресс: {success_count + fail_count}/{total_users}\n"
-                    f"Успешно: {success_count}\n"
-                    f"Ошибок: {fail_count}\n\n"
-                    f"{broadcast_text}",
-                    parse_mode="HTML"
-                )
-            except Exception:
-                pass # Игнорируем ошибки редактирования сообщения о прогрессе
-
-    # Финальный отчет
-    await confirm_msg.edit_text(
-        f"✅ Рассылка завершена!\n"
-        f"Всего пользователей: {total_users}\n"
-        f"Успешно: {success_count}\n"
-        f"Ошибок: {fail_count}\n\n"
-        f"Отправленное сообщение:\n{broadcast_text}",
-        parse_mode="HTML"
+    # Задание сохраняется в базе и отправляется в фоне, даже после перезапуска
+    job = await BroadcastService.create_broadcast(
+        db,
+        text=broadcast_text,
+        created_by=message.from_user.id,
+        report_chat_id=confirm_msg.chat.id,
+        report_message_id=confirm_msg.message_id,
     )
 
+    if not job.total:
+        await confirm_msg.edit_text("❌ Нет пользователей для отправки сообщения.")
+
 # ВОССТАНОВЛЕННЫЙ ОБРАБОТЧИК
 @router.message(F.text.startswith("/delete_post "))
 async def cmd_delete_post(message: Message, db):
@@ -314,7 +262,7 @@ async def cmd_liked_posts(message: Message, db):
         except Exception as e:
             logfire.warning(f"Ошибка отправки гифки избранного: {e}")
 
-    posts = await PostService.get_liked_posts(db, message.from_user.id, POSTS_PER_PAGE, 0)
+    posts, total_posts = await PostService.get_liked_page(db, message.from_user.id, POSTS_PER_PAGE)
     if not posts:
         await message.answer(
             "У вас пока нет избранных мероприятий\n"
@@ -327,7 +275,6 @@ async def cmd_liked_posts(message: Message, db):
         )
         return
 
-    total_posts = await PostService.get_liked_posts_count(db, message.from_user.id)
     total_pages = (total_posts + POSTS_PER_PAGE - 1) // POSTS_PER_PAGE
     text = format_liked_list(posts, 1, total_posts)
 
@@ -390,7 +337,7 @@ async def cmd_change_category(message: Message, state: FSMContext, db):
     await state.set_state(UserStates.waiting_for_categories)
 
 # ВОССТАНОВЛЕННЫЙ ОБРАБОТЧИК
-@router.message(F.text == "/help")
+@router.message(F.text == "/help", flags={"db": False})
 async def cmd_help(message: Message):
     """Обработчик команды /help"""
     help_text = """Справка по Сердцу. Основные функции:
@@ -476,7 +423,7 @@ async def show_my_posts_callback(callback: CallbackQuery, db):
     await callback.answer()
 
 # ВОССТАНОВЛЕННЫЙ ОБРАБОТЧИК
-@router.callback_query(F.data == "help")
+@router.callback_query(F.data == "help", flags={"db": False})
 async def show_help_callback(callback: CallbackQuery):
     """Показать справку через инлайн-кнопку"""
     help_text = """Справка по Сердцу. Основные функции:
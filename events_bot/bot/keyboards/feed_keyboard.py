@@ -1,29 +1,41 @@
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import InlineKeyboardMarkup
+from events_bot.utils import post_cursor
 
+# Формат callback_data (лимит Telegram — 64 байта):
+#   <section>_open_<post_id>_<page>_<total>_<cursor первого поста страницы>
+#   <section>_prev_<page>_<total>_<cursor первого поста страницы>
+#   <section>_next_<page>_<total>_<cursor последнего поста страницы>
+#   <section>_back_<page>_<total>_<cursor первого поста страницы>
+#   <section>_heart_<post_id>_<page>_<total>_<cursor первого поста страницы>
+# Курсор — короткая строка из events_bot.utils.pagination без символа «_».
 
-def get_feed_list_keyboard(
-    posts, current_page: int, total_pages: int, start_index: int = 1
+
+def _build_list_keyboard(
+    section: str, posts, current_page: int, total_pages: int, start_index: int
 ) -> InlineKeyboardMarkup:
-    """Клавиатура списка постов (подборка)"""
     builder = InlineKeyboardBuilder()
+    first_cursor = post_cursor(posts[0]) if posts else ""
+    last_cursor = post_cursor(posts[-1]) if posts else ""
 
     # Кнопки с цифрами — все в одной строке
     for idx, post in enumerate(posts, start=start_index):
         builder.button(
             text=f"{idx}",
-            callback_data=f"feed_open_{post.id}_{current_page}_{total_pages}"
+            callback_data=f"{section}_open_{post.id}_{current_page}_{total_pages}_{first_cursor}"
         )
 
     # Навигация (если есть)
     if current_page > 0 or current_page < total_pages - 1:
         if current_page > 0:
             builder.button(
-                text="‹ Назад", callback_data=f"feed_prev_{current_page}_{total_pages}"
+                text="‹ Назад",
+                callback_data=f"{section}_prev_{current_page}_{total_pages}_{first_cursor}",
             )
         if current_page < total_pages - 1:
             builder.button(
-                text="Вперед ›", callback_data=f"feed_next_{current_page}_{total_pages}"
+                text="Вперед ›",
+                callback_data=f"{section}_next_{current_page}_{total_pages}_{last_cursor}",
             )
 
     # Кнопка "Главное меню" — всегда на отдельной строке
@@ -41,64 +53,30 @@ def get_feed_list_keyboard(
     return builder.as_markup()
 
 
-def get_liked_list_keyboard(
-    posts, current_page: int, total_pages: int, start_index: int = 1
-) -> InlineKeyboardMarkup:
-    """Клавиатура списка избранных постов"""
-    builder = InlineKeyboardBuilder()
-
-    # Кнопки с цифрами
-    for idx, post in enumerate(posts, start=start_index):
-        builder.button(
-            text=f"{idx}",
-            callback_data=f"liked_open_{post.id}_{current_page}_{total_pages}"
-        )
-
-    # Навигация
-    if current_page > 0 or current_page < total_pages - 1:
-        if current_page > 0:
-            builder.button(
-                text="‹ Назад", callback_data=f"liked_prev_{current_page}_{total_pages}"
-            )
-        if current_page < total_pages - 1:
-            builder.button(
-                text="Вперед ›", callback_data=f"liked_next_{current_page}_{total_pages}"
-            )
-
-    # Главное меню — всегда внизу
-    builder.button(text="💌 Главное меню", callback_data="main_menu")
-
-    # Расположение: как в ленте
-    if current_page > 0 or current_page < total_pages - 1:
-        builder.adjust(len(posts), 2, 1)
-    else:
-        builder.adjust(len(posts), 1)
-
-    return builder.as_markup()
-
-
-def get_feed_post_keyboard(
+def _build_post_keyboard(
+    section: str,
     current_page: int,
     total_pages: int,
     post_id: int,
-    is_liked: bool = False,
-    url: str | None = None,
+    is_liked: bool,
+    url: str | None,
+    cursor: str,
 ) -> InlineKeyboardMarkup:
-    """Клавиатура для детального просмотра поста в ленте"""
     builder = InlineKeyboardBuilder()
     heart_text = "❤️ В избранном" if is_liked else "🤍 В избранное"
 
     # Добавляем кнопки в нужном порядке
     builder.button(
         text=heart_text,
-        callback_data=f"feed_heart_{post_id}_{current_page}_{total_pages}"
+        callback_data=f"{section}_heart_{post_id}_{current_page}_{total_pages}_{cursor}"
     )
-    
+
     if url:
         builder.button(text="🔗 Ссылка", url=url)
-    
+
     builder.button(
-        text="‹ К списку", callback_data=f"feed_back_{current_page}_{total_pages}"
+        text="‹ К списку",
+        callback_data=f"{section}_back_{current_page}_{total_pages}_{cursor}",
     )
     builder.button(
         text="💌 Главное меню", callback_data="main_menu"
@@ -113,36 +91,43 @@ def get_feed_post_keyboard(
     return builder.as_markup()
 
 
-def get_liked_post_keyboard(
+def get_feed_list_keyboard(
+    posts, current_page: int, total_pages: int, start_index: int = 1
+) -> InlineKeyboardMarkup:
+    """Клавиатура списка постов (подборка)"""
+    return _build_list_keyboard("feed", posts, current_page, total_pages, start_index)
+
+
+def get_liked_list_keyboard(
+    posts, current_page: int, total_pages: int, start_index: int = 1
+) -> InlineKeyboardMarkup:
+    """Клавиатура списка избранных постов"""
+    return _build_list_keyboard("liked", posts, current_page, total_pages, start_index)
+
+
+def get_feed_post_keyboard(
     current_page: int,
     total_pages: int,
     post_id: int,
     is_liked: bool = False,
     url: str | None = None,
+    cursor: str = "",
 ) -> InlineKeyboardMarkup:
-    """Клавиатура для детального просмотра поста в избранном"""
-    builder = InlineKeyboardBuilder()
-    heart_text = "❤️ В избранном" if is_liked else "🤍 В избранное"
-
-    builder.button(
-        text=heart_text,
-        callback_data=f"liked_heart_{post_id}_{current_page}_{total_pages}"
-    )
-    
-    if url:
-        builder.button(text="🔗 Ссылка", url=url)
-    
-    builder.button(
-        text="‹ К списку", callback_data=f"liked_back_{current_page}_{total_pages}"
-    )
-    builder.button(
-        text="💌 Главное меню", callback_data="main_menu"
+    """Клавиатура для детального просмотра поста в ленте"""
+    return _build_post_keyboard(
+        "feed", current_page, total_pages, post_id, is_liked, url, cursor
     )
 
-    # Располагаем: если есть ссылка — 2 в ряд, иначе 1 + 2
-    if url:
-        builder.adjust(2, 2)  # [лайк][ссылка] [назад][меню]
-    else:
-        builder.adjust(1, 2)  # [лайк] [назад][меню]
 
-    return builder.as_markup()
+def get_liked_post_keyboard(
+    current_page: int,
+    total_pages: int,
+    post_id: int,
+    is_liked: bool = False,
+    url: str | None = None,
+    cursor: str = "",
+) -> InlineKeyboardMarkup:
+    """Клавиатура для детального просмотра поста в избранном"""
+    return _build_post_keyboard(
+        "liked", current_page, total_pages, post_id, is_liked, url, cursor
+    )
@@ -1,19 +1,26 @@
 from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
 from aiogram.types import TelegramObject
 from typing import Callable, Dict, Any, Awaitable
-from events_bot.bot.utils import get_db_session
+from events_bot.bot.utils import LazySession
 
 
 class DatabaseMiddleware(BaseMiddleware):
-    """Middleware для автоматического получения сессии базы данных"""
-    
+    """Middleware для ленивого получения сессии базы данных
+
+    Сессия создается только при первом запросе обработчика к базе.
+    Обработчики с флагом ``flags={"db": False}`` сессию не получают вовсе.
+    """
+
     async def __call__(
         self,
         handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
         event: TelegramObject,
         data: Dict[str, Any]
     ) -> Any:
-        async with get_db_session() as db:
-            data['db'] = db
+        if get_flag(data, "db", default=True) is False:
             return await handler(event, data)
 
+        async with LazySession() as db:
+            data['db'] = db
+            return await handler(event, data)
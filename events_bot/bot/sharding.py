@@ -0,0 +1,254 @@
+"""
+Многопроцессный режим (BOT_WORKERS > 1)
+
+Главный процесс только принимает обновления (polling или webhook) и
+раскладывает их по воркерам по id чата: все обновления одного чата
+обрабатывает один воркер и строго по порядку, поэтому шаги FSM не
+перемешиваются. Каждый воркер — отдельный процесс со своим пулом
+соединений и ботом; состояния FSM общие (FSM_STORAGE=sql или redis).
+Фоновые задачи и рассылки работают только в воркере 0, лимит отправки
+FANOUT_RATE делится между воркерами поровну.
+
+Порядок обновлений чата — порядок, в котором их получил главный процесс.
+В режиме webhook Telegram может прислать обновления одного чата
+параллельными запросами; для строгого порядка нужен
+WEBHOOK_MAX_CONNECTIONS=1.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import queue as queue_module
+import signal
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import logfire
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+from aiogram.types import Update
+
+from ..database import init_engine, dispose_engine
+from ..storage import file_storage
+from ..utils import cancel_background_tasks, share_fanout_rate
+from .app import create_dispatcher, run_background_tasks
+from .fsm_storage import get_fsm_storage
+
+# Воркер, в котором работают фоновые задачи
+LEADER_WORKER = 0
+
+
+def chat_key(update: Update) -> int:
+    """id чата обновления (или пользователя, если чата нет)"""
+    context = UserContextMiddleware.resolve_event_context(update)
+    return context.chat_id or context.user_id or 0
+
+
+class ShardingMiddleware(BaseMiddleware):
+    """Внешний middleware главного процесса: пересылает обновление воркеру
+
+    Обработчики в главном процессе не вызываются. Обновление сразу, без
+    переключения задач, встает в очередь своего воркера в памяти, и одна
+    задача на воркер по порядку перекладывает их в очередь процесса.
+    Так порядок сохраняется и при параллельной обработке (webhook).
+    """
+
+    def __init__(self, queues: List[multiprocessing.Queue]):
+        self.queues = queues
+        self._pending: List[asyncio.Queue] = []
+        self._feeders: List[asyncio.Task] = []
+
+    async def _feed(self, index: int) -> None:
+        loop = asyncio.get_running_loop()
+        pending = self._pending[index]
+        while True:
+            payload, handed = await pending.get()
+            try:
+                # Очередь процесса ограничена: если воркер не успевает,
+                # прием притормаживает
+                await loop.run_in_executor(None, self.queues[index].put, payload)
+                if not handed.done():
+                    handed.set_result(None)
+            except Exception as e:
+                if not handed.done():
+                    handed.set_exception(e)
+
+    async def close(self) -> None:
+        """Остановить перекладчиков (все обновления к этому моменту переданы)"""
+        for feeder in self._feeders:
+            feeder.cancel()
+        await asyncio.gather(*self._feeders, return_exceptions=True)
+        self._feeders = []
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not self._feeders:
+            self._pending = [asyncio.Queue() for _ in self.queues]
+            self._feeders = [
+                asyncio.create_task(self._feed(index)) for index in range(len(self.queues))
+            ]
+        index = chat_key(event) % len(self.queues)
+        payload = event.model_dump_json(exclude_unset=True, by_alias=True)
+        handed: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._pending[index].put_nowait((payload, handed))
+        # Ждем передачи воркеру: так сохраняется ограничение на прием
+        await handed
+
+
+class OrderedUpdateRunner:
+    """Обработка обновлений воркером: параллельно, но по порядку внутри чата"""
+
+    def __init__(self, dp: Dispatcher, bot: Bot, max_in_flight: int):
+        self.dp = dp
+        self.bot = bot
+        self._slots = asyncio.Semaphore(max_in_flight)
+        # Последняя задача каждого чата: следующая ждет ее завершения
+        self._chains: Dict[int, asyncio.Task] = {}
+
+    async def _process(self, previous: Optional[asyncio.Task], update: Update) -> None:
+        try:
+            if previous:
+                await asyncio.wait([previous])
+            await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            logfire.error(f"Ошибка обработки обновления {update.update_id}: {e}")
+        finally:
+            self._slots.release()
+
+    def _forget(self, chat_id: int, task: asyncio.Task) -> None:
+        if self._chains.get(chat_id) is task:
+            del self._chains[chat_id]
+
+    async def submit(self, update: Update) -> None:
+        await self._slots.acquire()
+        chat_id = chat_key(update)
+        task = asyncio.create_task(self._process(self._chains.get(chat_id), update))
+        self._chains[chat_id] = task
+        task.add_done_callback(lambda t: self._forget(chat_id, t))
+
+    async def drain(self) -> None:
+        if self._chains:
+            await asyncio.gather(*self._chains.values(), return_exceptions=True)
+
+
+def _next_payload(queue: multiprocessing.Queue) -> Tuple[bool, Optional[str]]:
+    """Дождаться обновления из очереди (блокирующая функция)
+
+    Возвращает (False, None), если главный процесс завершился, не
+    отправив сигнал остановки: воркер не должен остаться сиротой.
+    """
+    parent = multiprocessing.parent_process()
+    while True:
+        try:
+            return True, queue.get(timeout=1)
+        except queue_module.Empty:
+            if parent is not None and not parent.is_alive():
+                return False, None
+
+
+async def _run_worker(
+    index: int, workers: int, token: str, queue: multiprocessing.Queue
+) -> None:
+    share_fanout_rate(workers)
+    init_engine()
+    await file_storage.start()
+    bot = Bot(token=token)
+    storage = get_fsm_storage()
+    dp = create_dispatcher(storage)
+    runner = OrderedUpdateRunner(
+        dp, bot, int(os.getenv("WORKER_MAX_IN_FLIGHT", "100"))
+    )
+    background = (
+        asyncio.create_task(run_background_tasks(bot, storage))
+        if index == LEADER_WORKER
+        else None
+    )
+    logfire.info(f"🤖 Воркер {index} запущен")
+    loop = asyncio.get_running_loop()
+    try:
+        await dp.emit_startup(bot=bot, dispatcher=dp)
+        while True:
+            alive, payload = await loop.run_in_executor(None, _next_payload, queue)
+            if not alive:
+                logfire.warning(f"Воркер {index}: главный процесс завершился")
+                break
+            if payload is None:
+                break
+            await runner.submit(Update.model_validate_json(payload, context={"bot": bot}))
+        await runner.drain()
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+    finally:
+        if background:
+            background.cancel()
+            await asyncio.gather(background, return_exceptions=True)
+        await cancel_background_tasks()
+        await bot.session.close()
+        await storage.close()
+        await file_storage.close()
+        await dispose_engine()
+        logfire.info(f"🛑 Воркер {index} остановлен")
+
+
+def worker_main(
+    index: int, workers: int, token: str, queue: multiprocessing.Queue
+) -> None:
+    """Точка входа процесса-воркера"""
+    # Останавливается по сигналу главного процесса (None в очереди),
+    # чтобы сначала доработать полученные обновления. SIGINT и SIGTERM
+    # от терминала или systemd приходят всей группе процессов, поэтому
+    # игнорируются; зависший воркер главный процесс завершает через SIGKILL.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    asyncio.run(_run_worker(index, workers, token, queue))
+
+
+async def run_sharded(
+    token: str,
+    workers: int,
+    receive: Callable[[Dispatcher, Bot], Awaitable[None]],
+) -> None:
+    """Запустить воркеры и принимать обновления в этом процессе
+
+    receive(dp, bot) — прием обновлений (polling или webhook), возвращается
+    при остановке бота.
+    """
+    # spawn: воркер не наследует цикл событий и соединения главного процесса
+    context = multiprocessing.get_context("spawn")
+    queue_size = int(os.getenv("WORKER_QUEUE_SIZE", "1000"))
+    queues = [context.Queue(maxsize=queue_size) for _ in range(workers)]
+    processes = [
+        context.Process(
+            target=worker_main,
+            args=(i, workers, token, queues[i]),
+            name=f"bot-worker-{i}",
+        )
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    bot = Bot(token=token)
+    # Обработчики регистрируются, чтобы polling запросил нужные типы обновлений
+    dp = create_dispatcher()
+    sharding = ShardingMiddleware(queues)
+    dp.update.outer_middleware(sharding)
+    logfire.info(f"🤖 Bot started: {workers} воркеров")
+    try:
+        await receive(dp, bot)
+    finally:
+        await sharding.close()
+        loop = asyncio.get_running_loop()
+        for queue in queues:
+            await loop.run_in_executor(None, queue.put, None)
+        timeout = float(os.getenv("WORKER_STOP_TIMEOUT", "30"))
+        for process in processes:
+            await loop.run_in_executor(None, process.join, timeout)
+            if process.is_alive():
+                logfire.warning(f"Воркер {process.name} не остановился, завершаем")
+                # SIGTERM воркер игнорирует
+                process.kill()
+                await loop.run_in_executor(None, process.join)
+        await bot.session.close()
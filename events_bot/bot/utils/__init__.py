@@ -1,5 +1,6 @@
-from .database import get_db_session
+from .database import get_db_session, LazySession
 
 __all__ = [
-    "get_db_session"
+    "get_db_session",
+    "LazySession",
 ]
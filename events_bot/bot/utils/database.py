@@ -1,8 +1,41 @@
-from sqlalchemy.ext.asyncio import AsyncSession
-from events_bot.database import create_async_engine_and_session
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from events_bot.database import get_session_maker
 
 
-def get_db_session():
-    """Получить сессию базы данных"""
-    engine, session_maker = create_async_engine_and_session()
-    return session_maker()
+def get_db_session() -> AsyncSession:
+    """Получить сессию базы данных из общего пула"""
+    return get_session_maker()()
+
+
+class LazySession:
+    """Прокси сессии: сессия создается при первом обращении обработчика к базе"""
+
+    def __init__(self, session_maker: async_sessionmaker[AsyncSession] | None = None):
+        self._session_maker = session_maker
+        self._session: AsyncSession | None = None
+
+    @property
+    def is_opened(self) -> bool:
+        """Была ли сессия реально открыта"""
+        return self._session is not None
+
+    def _get_session(self) -> AsyncSession:
+        if self._session is None:
+            session_maker = self._session_maker or get_session_maker()
+            self._session = session_maker()
+        return self._session
+
+    def __getattr__(self, name: str):
+        return getattr(self._get_session(), name)
+
+    async def close(self) -> None:
+        """Закрыть сессию, если она была открыта"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self) -> "LazySession":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
@@ -0,0 +1,164 @@
+"""
+Прием обновлений Telegram через webhook (BOT_MODE=webhook)
+
+Несколько процессов бота могут стоять за одним балансировщиком: состояние
+FSM общее (см. fsm_storage), а каждый процесс обрабатывает только
+пришедшие ему обновления.
+
+Проверка без Telegram — отправить записанное обновление:
+
+    curl -X POST http://127.0.0.1:8080/webhook \\
+        -H "Content-Type: application/json" \\
+        -H "X-Telegram-Bot-Api-Secret-Token: $WEBHOOK_SECRET" \\
+        -d @update.json
+"""
+
+import asyncio
+import hmac
+import os
+import signal
+from typing import Optional, Set
+
+import logfire
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """aiohttp-приложение, передающее обновления диспетчеру aiogram
+
+    Ответ Telegram отправляется сразу, а обновление обрабатывается в фоне.
+    Одновременно обрабатывается не больше max_in_flight обновлений: когда
+    все слоты заняты, запрос ждет свободного, и Telegram сам притормаживает.
+    """
+
+    def __init__(
+        self,
+        dp: Dispatcher,
+        bot: Bot,
+        path: str = "/webhook",
+        secret: Optional[str] = None,
+        max_in_flight: int = 100,
+        drain_timeout: float = 30,
+    ):
+        self.dp = dp
+        self.bot = bot
+        self.path = path
+        self.secret = secret
+        self.drain_timeout = drain_timeout
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._tasks: Set[asyncio.Task] = set()
+        self._closing = False
+
+    def _is_authorized(self, request: web.Request) -> bool:
+        if not self.secret:
+            return True
+        return hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """Принять одно обновление"""
+        if not self._is_authorized(request):
+            return web.Response(status=401)
+        if self._closing:
+            # Процесс останавливается: Telegram повторит запрос позже
+            return web.Response(status=503)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception as e:
+            logfire.warning(f"Некорректное обновление в webhook: {e}")
+            return web.Response(status=400)
+
+        await self._slots.acquire()
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def _process(self, update: Update) -> None:
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            logfire.error(f"Ошибка обработки обновления {update.update_id}: {e}")
+        finally:
+            self._slots.release()
+
+    async def health(self, request: web.Request) -> web.Response:
+        """Проверка живости для балансировщика"""
+        return web.Response(status=503 if self._closing else 200, text="ok")
+
+    async def drain(self, app: Optional[web.Application] = None) -> None:
+        """Перестать принимать обновления и дождаться начатых"""
+        self._closing = True
+        if not self._tasks:
+            return
+        logfire.info(f"Ожидаем обработки {len(self._tasks)} обновлений")
+        _, pending = await asyncio.wait(self._tasks, timeout=self.drain_timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logfire.warning(f"Прервана обработка {len(pending)} обновлений")
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        app.router.add_get("/healthz", self.health)
+        # on_shutdown вызывается, когда сервер уже не принимает соединения
+        app.on_shutdown.append(self.drain)
+        return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot) -> None:
+    """Запустить webhook-сервер и работать до SIGINT/SIGTERM"""
+    host = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+    port = int(os.getenv("WEBHOOK_PORT", "8080"))
+    path = os.getenv("WEBHOOK_PATH", "/webhook")
+    secret = os.getenv("WEBHOOK_SECRET") or None
+    # Публичный адрес; если задан, webhook регистрируется при старте
+    public_url = os.getenv("WEBHOOK_URL")
+
+    server = WebhookServer(
+        dp,
+        bot,
+        path=path,
+        secret=secret,
+        max_in_flight=int(os.getenv("WEBHOOK_MAX_IN_FLIGHT", "100")),
+        drain_timeout=float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "30")),
+    )
+    if not secret:
+        logfire.warning("WEBHOOK_SECRET не задан: запросы к webhook не проверяются")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+
+    runner = web.AppRunner(server.create_app())
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    try:
+        if public_url:
+            await bot.set_webhook(
+                url=public_url.rstrip("/") + path,
+                secret_token=secret,
+                allowed_updates=dp.resolve_used_update_types(),
+                max_connections=int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40")),
+            )
+            logfire.info(f"🌐 Webhook зарегистрирован: {public_url.rstrip('/')}{path}")
+        logfire.info(f"🌐 Webhook-сервер слушает {host}:{port}{path}")
+        await stop.wait()
+    finally:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.remove_signal_handler(sig)
+            except NotImplementedError:
+                pass
+        await runner.cleanup()
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
@@ -1,5 +1,13 @@
 from .models import Base, User, Category, Post, ModerationRecord, City
-from .connection import create_async_engine_and_session, create_tables, get_db
+from .connection import (
+    create_async_engine_and_session,
+    create_tables,
+    get_db,
+    init_engine,
+    get_engine,
+    get_session_maker,
+    dispose_engine,
+)
 from .repositories import (
     UserRepository,
     CategoryRepository,
@@ -21,6 +29,10 @@ __all__ = [
     "create_async_engine_and_session",
     "create_tables",
     "get_db",
+    "init_engine",
+    "get_engine",
+    "get_session_maker",
+    "dispose_engine",
     # Repпозитории
     "UserRepository",
     "CategoryRepository",
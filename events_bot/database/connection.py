@@ -1,4 +1,9 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from sqlalchemy.ext.asyncio import (
+    create_async_engine,
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+)
 from sqlalchemy.orm import DeclarativeBase
 import os
 from .models import Base
@@ -20,21 +25,63 @@ def get_database_url():
         else:
             return database_url
 
-        
-already_instrumented = False
+
+def get_engine_options(database_url: str) -> dict:
+    """Параметры пула соединений из переменных окружения"""
+    options = {
+        "echo": os.getenv("DB_ECHO", "true").lower() == "true",
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() == "true",
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", 1800)),
+    }
+    # SQLite работает без сетевого пула, размер пула для него не задаем
+    if not database_url.startswith("sqlite"):
+        options["pool_size"] = int(os.getenv("DB_POOL_SIZE", 10))
+        options["max_overflow"] = int(os.getenv("DB_MAX_OVERFLOW", 20))
+        options["pool_timeout"] = int(os.getenv("DB_POOL_TIMEOUT", 30))
+    return options
+
+
+# Единый движок и фабрика сессий на весь процесс
+_engine: AsyncEngine | None = None
+_session_maker: async_sessionmaker[AsyncSession] | None = None
+
+
+def init_engine() -> AsyncEngine:
+    """Создает движок и фабрику сессий процесса (повторный вызов ничего не делает)"""
+    global _engine, _session_maker
+    if _engine is None:
+        database_url = get_database_url()
+        _engine = create_async_engine(database_url, **get_engine_options(database_url))
+        _session_maker = async_sessionmaker(
+            _engine, class_=AsyncSession, expire_on_commit=False
+        )
+        instrument_sqlalchemy(_engine)
+    return _engine
+
+
+def get_engine() -> AsyncEngine:
+    """Получить общий движок базы данных"""
+    return init_engine()
+
+
+def get_session_maker() -> async_sessionmaker[AsyncSession]:
+    """Получить общую фабрику сессий"""
+    init_engine()
+    return _session_maker
+
+
+async def dispose_engine() -> None:
+    """Закрыть пул соединений при остановке приложения"""
+    global _engine, _session_maker
+    if _engine is not None:
+        await _engine.dispose()
+        _engine = None
+        _session_maker = None
+
 
 def create_async_engine_and_session():
-    """Создает асинхронный движок базы данных и сессию"""
-    database_url = get_database_url()
-    engine = create_async_engine(database_url, echo=True)
-    session_maker = async_sessionmaker(
-        engine, class_=AsyncSession, expire_on_commit=False
-    )
-    global already_instrumented
-    if not already_instrumented:
-        instrument_sqlalchemy(engine)
-        already_instrumented = True
-    return engine, session_maker
+    """Возвращает общий движок базы данных и фабрику сессий"""
+    return get_engine(), get_session_maker()
 
 
 async def create_tables(engine):
@@ -45,8 +92,7 @@ async def create_tables(engine):
 
 async def get_db():
     """Асинхронный генератор для получения сессии базы данных"""
-    engine, session_maker = create_async_engine_and_session()
-    async with session_maker() as session:
+    async with get_session_maker()() as session:
         try:
             yield session
         finally:
@@ -1,11 +1,12 @@
-from .connection import create_async_engine_and_session, create_tables
-from .repositories import CategoryRepository, CityRepository
+from .connection import get_engine, get_session_maker, create_tables
+from .repositories import CategoryRepository, CityRepository, FeedRepository
 import logfire
 
 
 async def init_database():
     """Асинхронная инициализация базы данных с примерами категорий и городов"""
-    engine, session_maker = create_async_engine_and_session()
+    engine = get_engine()
+    session_maker = get_session_maker()
 
     # Создаем таблицы
     await create_tables(engine)
@@ -54,13 +55,22 @@ async def init_database():
             else:
                 logfire.info(f"Database already has {len(existing_cities)} cities")
 
+            # Заполняем материализованную ленту, если таблица только что создана
+            if await FeedRepository.is_empty(db):
+                await FeedRepository.rebuild_all(db)
+                logfire.info("User feed index rebuilt")
+
         except Exception as e:
             logfire.error(f"Error initializing database: {e}")
             await db.rollback()
 
-    await engine.dispose()
-
 
 if __name__ == "__main__":
     import asyncio
-    asyncio.run(init_database())
+    from .connection import dispose_engine
+
+    async def _run():
+        await init_database()
+        await dispose_engine()
+
+    asyncio.run(_run())
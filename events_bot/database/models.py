@@ -8,7 +8,10 @@ from sqlalchemy import (
     func,
     Column,
     BigInteger,
+    Integer,
     UniqueConstraint,
+    Index,
+    text,
 )
 from datetime import datetime, timezone
 from sqlalchemy.orm import DeclarativeBase, mapped_column, relationship
@@ -46,6 +49,8 @@ user_categories = Table(
     Base.metadata,
     Column("user_id", ForeignKey("users.id"), primary_key=True),
     Column("category_id", ForeignKey("categories.id"), primary_key=True),
+    # Обратный поиск пользователей по категории (получатели уведомлений)
+    Index("ix_user_categories_category_id", "category_id", "user_id"),
 )
 
 # Таблица связи многие-ко-многим для пользователей и городов
@@ -54,6 +59,8 @@ user_cities = Table(
     Base.metadata,
     Column("user_id", ForeignKey("users.id"), primary_key=True),
     Column("city_id", ForeignKey("cities.id"), primary_key=True),
+    # Обратный поиск пользователей по городу (получатели уведомлений)
+    Index("ix_user_cities_city_id", "city_id", "user_id"),
 )
 
 # Таблица связи многие-ко-многим для постов и категорий
@@ -62,6 +69,8 @@ post_categories = Table(
     Base.metadata,
     Column("post_id", ForeignKey("posts.id"), primary_key=True),
     Column("category_id", ForeignKey("categories.id"), primary_key=True),
+    # Обратный поиск постов по категории
+    Index("ix_post_categories_category_id", "category_id", "post_id"),
 )
 
 # Таблица связи многие-ко-многим для постов и городов
@@ -70,6 +79,21 @@ post_cities = Table(
     Base.metadata,
     Column("post_id", ForeignKey("posts.id"), primary_key=True),
     Column("city_id", ForeignKey("cities.id"), primary_key=True),
+    # Обратный поиск постов по городу
+    Index("ix_post_cities_city_id", "city_id", "post_id"),
+)
+
+# Материализованная лента: посты, подходящие пользователю по категориям и вузам.
+# Поддерживается инкрементально репозиторием FeedRepository
+user_feed = Table(
+    "user_feed",
+    Base.metadata,
+    Column("user_id", ForeignKey("users.id"), primary_key=True),
+    Column("post_id", ForeignKey("posts.id"), primary_key=True),
+    Column("event_at", DateTime, nullable=True),
+    Index("ix_user_feed_user_event", "user_id", "event_at", "post_id"),
+    # Удаление поста из всех лент
+    Index("ix_user_feed_post_id", "post_id"),
 )
 
 
@@ -148,6 +172,8 @@ class Post(Base, TimestampMixin):
     content: Mapped[str] = mapped_column(Text, nullable=False)
     author_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
     image_id: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    # file_id фото в Telegram: после первой отправки фото не читается из хранилища
+    tg_file_id: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
     url: Mapped[Optional[str]] = mapped_column(String(1024), nullable=True)  # Ссылка
     is_approved: Mapped[bool] = mapped_column(Boolean, default=False)
     is_published: Mapped[bool] = mapped_column(Boolean, default=False)
@@ -157,6 +183,10 @@ class Post(Base, TimestampMixin):
     event_at: Mapped[Optional[DateTime]] = mapped_column(DateTime, nullable=True)
     # Адрес мероприятия
     address: Mapped[Optional[str]] = mapped_column(String(200), nullable=True)
+    # Количество лайков (денормализовано, сверяется с likes фоновой задачей)
+    likes_count: Mapped[int] = mapped_column(
+        Integer, default=0, server_default="0", nullable=False
+    )
 
     # Связи
     author: Mapped[User] = relationship(back_populates="posts")
@@ -170,6 +200,30 @@ class Post(Base, TimestampMixin):
         back_populates="post"
     )
 
+    __table_args__ = (
+        # Поиск просроченных постов
+        Index("ix_posts_event_at", "event_at"),
+        # Посты автора (/my_posts, удаление пользователя)
+        Index("ix_posts_author_id", "author_id"),
+        # Проверка, используется ли картинка другими постами
+        Index("ix_posts_image_id", "image_id"),
+        # Опубликованные посты по дате события (частичный индекс)
+        Index(
+            "ix_posts_published_event_at",
+            "event_at",
+            "id",
+            postgresql_where=text("is_approved AND is_published"),
+            sqlite_where=text("is_approved = 1 AND is_published = 1"),
+        ),
+        # Очередь модерации (частичный индекс)
+        Index(
+            "ix_posts_pending_moderation",
+            "id",
+            postgresql_where=text("NOT is_approved AND NOT is_published"),
+            sqlite_where=text("is_approved = 0 AND is_published = 0"),
+        ),
+    )
+
 
 class ModerationRecord(Base, TimestampMixin):
     """Модель записи модерации"""
@@ -188,6 +242,11 @@ class ModerationRecord(Base, TimestampMixin):
     post: Mapped[Post] = relationship(back_populates="moderation_records")
     moderator: Mapped[User] = relationship()
 
+    __table_args__ = (
+        Index("ix_moderation_records_post_id", "post_id"),
+        Index("ix_moderation_records_moderator_id", "moderator_id"),
+    )
+
 
 class Like(Base, TimestampMixin):
     """Модель лайка пользователя на пост"""
@@ -203,10 +262,108 @@ class Like(Base, TimestampMixin):
     post: Mapped[Post] = relationship()
 
     # Уникальный индекс для предотвращения дублирования лайков
-    __table_args__ = (UniqueConstraint("user_id", "post_id", name="uq_like_user_post"),)
+    # и индекс по посту для подсчета лайков
+    __table_args__ = (
+        UniqueConstraint("user_id", "post_id", name="uq_like_user_post"),
+        Index("ix_likes_post_id", "post_id"),
+    )
 
 
 class ModerationAction(str, Enum):
     APPROVE = "approve"
     REJECT = "reject"
     REQUEST_CHANGES = "request_changes"
+
+
+class BroadcastStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+
+
+class DeliveryStatus(str, Enum):
+    PENDING = "pending"
+    SENDING = "sending"
+    SENT = "sent"
+    FAILED = "failed"
+
+
+class BroadcastJob(Base, TimestampMixin):
+    """Модель задания рассылки /broadcast"""
+
+    __tablename__ = "broadcast_jobs"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    text: Mapped[str] = mapped_column(Text, nullable=False)
+    created_by: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    status: Mapped[str] = mapped_column(
+        String(20), default=BroadcastStatus.PENDING.value, nullable=False
+    )  # pending, running, done
+    # Сообщение, в котором показывается прогресс рассылки
+    report_chat_id: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    report_message_id: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    total: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    sent: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    failed: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    finished_at: Mapped[Optional[DateTime]] = mapped_column(DateTime, nullable=True)
+
+    __table_args__ = (Index("ix_broadcast_jobs_status", "status", "id"),)
+
+
+class BroadcastDelivery(Base):
+    """Модель доставки рассылки одному пользователю"""
+
+    __tablename__ = "broadcast_deliveries"
+
+    job_id: Mapped[int] = mapped_column(
+        ForeignKey("broadcast_jobs.id"), primary_key=True
+    )
+    user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    status: Mapped[str] = mapped_column(
+        String(20), default=DeliveryStatus.PENDING.value, nullable=False
+    )  # pending, sending, sent, failed
+    error: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    # Метка пачки, в которой получатель взят на отправку
+    claimed_by: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)
+
+    # Выбор следующей пачки получателей задания
+    __table_args__ = (
+        Index("ix_broadcast_deliveries_job_status", "job_id", "status", "user_id"),
+    )
+
+
+class FSMRecord(Base):
+    """Модель состояния FSM пользователя (черновики постов, комментарии модераторов)"""
+
+    __tablename__ = "fsm_states"
+
+    # Ключ aiogram: bot_id:chat_id:user_id[:thread_id]:destiny
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    state: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    # Данные FSM в JSON
+    data: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    updated_at: Mapped[DateTime] = mapped_column(
+        DateTime, default=utc_now, onupdate=utc_now, nullable=False
+    )
+
+    # Удаление брошенных черновиков по TTL
+    __table_args__ = (Index("ix_fsm_states_updated_at", "updated_at"),)
+
+
+class PendingImage(Base):
+    """Загруженная картинка, пост с которой еще не создан
+
+    Одинаковые загрузки хранятся одним файлом. Пока пользователь заполняет
+    форму поста, файл может принадлежать только другому посту, и эта запись
+    не дает очистке удалить его вместе с тем постом.
+    """
+
+    __tablename__ = "pending_images"
+
+    image_id: Mapped[str] = mapped_column(String(255), primary_key=True)
+    created_at: Mapped[DateTime] = mapped_column(
+        DateTime, default=utc_now, nullable=False
+    )
+
+    # Удаление записей брошенных загрузок по TTL
+    __table_args__ = (Index("ix_pending_images_created_at", "created_at"),)
@@ -0,0 +1,164 @@
+"""Проверка планов горячих запросов
+
+Запуск: python -m events_bot.database.query_plans
+
+Для каждого горячего запроса репозиториев строится план (EXPLAIN QUERY PLAN
+в SQLite, EXPLAIN в PostgreSQL) и проверяется, что таблицы читаются по индексу,
+а не полным сканированием. В PostgreSQL на время проверки отключается
+enable_seqscan: на маленькой базе планировщик иначе честно выберет Seq Scan,
+а полное сканирование при отключенном seqscan остается только там, где
+подходящего индекса нет.
+"""
+import asyncio
+import re
+import sys
+from typing import Dict, List, Set
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from .connection import init_engine, get_engine, dispose_engine, create_tables
+from .models import (
+    Base,
+    Post,
+    PendingImage,
+    Like,
+    ModerationRecord,
+    post_categories,
+    post_cities,
+    user_categories,
+    user_cities,
+    user_feed,
+)
+from .repositories.post_repository import PostRepository, apply_keyset
+
+SAMPLE_ID = 1
+
+# Сканирование в плане SQLite: "SCAN posts" или "SCAN posts USING INDEX ix_..."
+SQLITE_SCAN = re.compile(r"^SCAN \w+(?: USING (?:COVERING )?INDEX (\w+))?")
+
+
+def partial_indexes() -> Set[str]:
+    """Частичные индексы: их допустимо читать целиком, они и есть выборка"""
+    return {
+        index.name
+        for table in Base.metadata.tables.values()
+        for index in table.indexes
+        if index.dialect_options["sqlite"]["where"] is not None
+    }
+
+
+def hot_queries() -> Dict[str, object]:
+    """Горячие запросы в той форме, в какой их выполняют репозитории"""
+    feed = PostRepository._feed_source(SAMPLE_ID)
+    return {
+        "feed_page": apply_keyset(feed, user_feed.c.event_at, user_feed.c.post_id),
+        "liked_page": PostRepository._liked_source(SAMPLE_ID),
+        "published_by_event": select(Post.id)
+        .where(Post.is_approved == True, Post.is_published == True)
+        .order_by(Post.event_at, Post.id),
+        "pending_moderation": select(Post.id).where(
+            Post.is_approved == False, Post.is_published == False
+        ),
+        "expired_posts": select(Post.id)
+        .where(Post.event_at.is_not(None), Post.event_at <= func.now())
+        .order_by(Post.event_at, Post.id)
+        .limit(500),
+        "next_event_at": select(func.min(Post.event_at)).where(
+            Post.event_at.is_not(None)
+        ),
+        "user_posts": select(Post.id).where(Post.author_id == SAMPLE_ID),
+        "used_image_ids": select(Post.image_id)
+        .where(Post.image_id.in_(["a.jpg", "b.jpg"]))
+        .union(
+            select(PendingImage.image_id).where(
+                PendingImage.image_id.in_(["a.jpg", "b.jpg"])
+            )
+        ),
+        "expired_pending_images": select(PendingImage.image_id)
+        .where(PendingImage.created_at < func.now())
+        .order_by(PendingImage.created_at)
+        .limit(500),
+        "posts_by_category": select(post_categories.c.post_id).where(
+            post_categories.c.category_id == SAMPLE_ID
+        ),
+        "posts_by_city": select(post_cities.c.post_id).where(
+            post_cities.c.city_id == SAMPLE_ID
+        ),
+        "users_by_category": select(user_categories.c.user_id).where(
+            user_categories.c.category_id == SAMPLE_ID
+        ),
+        "users_by_city": select(user_cities.c.user_id).where(
+            user_cities.c.city_id == SAMPLE_ID
+        ),
+        "post_likes_count": select(func.count(Like.id)).where(
+            Like.post_id == SAMPLE_ID
+        ),
+        "user_like": select(Like.id).where(
+            Like.user_id == SAMPLE_ID, Like.post_id == SAMPLE_ID
+        ),
+        "post_moderation_records": select(ModerationRecord.id).where(
+            ModerationRecord.post_id == SAMPLE_ID
+        ),
+        "feed_by_post": select(user_feed.c.user_id).where(
+            user_feed.c.post_id == SAMPLE_ID
+        ),
+    }
+
+
+async def explain(conn: AsyncConnection, stmt) -> List[str]:
+    """Получить план запроса построчно"""
+    sql = str(stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+    if conn.dialect.name == "sqlite":
+        result = await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")
+        return [row[-1] for row in result.all()]
+    result = await conn.exec_driver_sql(f"EXPLAIN {sql}")
+    return [row[0] for row in result.all()]
+
+
+def full_scans(dialect: str, plan: List[str]) -> List[str]:
+    """Строки плана с полным сканированием таблицы"""
+    if dialect == "sqlite":
+        allowed = partial_indexes()
+        scans = []
+        for line in plan:
+            match = SQLITE_SCAN.match(line.strip())
+            if match and match.group(1) not in allowed:
+                scans.append(line)
+        return scans
+    return [line for line in plan if "Seq Scan" in line]
+
+
+async def check_query_plans() -> bool:
+    """Проверить планы всех горячих запросов, вернуть True если все по индексам"""
+    engine = get_engine()
+    await create_tables(engine)
+    ok = True
+    async with engine.connect() as conn:
+        dialect = conn.dialect.name
+        if dialect == "postgresql":
+            await conn.exec_driver_sql("SET enable_seqscan = off")
+        for name, stmt in hot_queries().items():
+            plan = await explain(conn, stmt)
+            scans = full_scans(dialect, plan)
+            status = "OK" if not scans else "FULL SCAN"
+            print(f"[{status}] {name}")
+            for line in plan:
+                print(f"    {line}")
+            ok = ok and not scans
+        await conn.rollback()
+    return ok
+
+
+async def main() -> int:
+    init_engine()
+    try:
+        ok = await check_query_plans()
+    finally:
+        await dispose_engine()
+    print("Все горячие запросы используют индексы" if ok else "Есть запросы без индекса")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -4,6 +4,8 @@ from .post_repository import PostRepository
 from .moderation_repository import ModerationRepository
 from .like_repository import LikeRepository
 from .city_repository import CityRepository
+from .feed_repository import FeedRepository
+from .broadcast_repository import BroadcastRepository
 
 __all__ = [
     "UserRepository",
@@ -12,4 +14,6 @@ __all__ = [
     "ModerationRepository",
     "LikeRepository",
     "CityRepository",
+    "FeedRepository",
+    "BroadcastRepository",
 ]
@@ -0,0 +1,266 @@
+import uuid
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+from sqlalchemy import select, update, insert, func, literal
+from typing import Dict, List, Optional
+from datetime import datetime, timezone
+from ..models import (
+    User,
+    BroadcastJob,
+    BroadcastDelivery,
+    BroadcastStatus,
+    DeliveryStatus,
+)
+
+
+class BroadcastRepository:
+    """Репозиторий заданий рассылки и их доставок"""
+
+    @staticmethod
+    async def create_job(
+        db: AsyncSession,
+        text: str,
+        created_by: int,
+        report_chat_id: Optional[int] = None,
+        report_message_id: Optional[int] = None,
+    ) -> BroadcastJob:
+        """Создать задание и строки доставки для всех активных пользователей"""
+        job = BroadcastJob(
+            text=text,
+            created_by=created_by,
+            report_chat_id=report_chat_id,
+            report_message_id=report_message_id,
+        )
+        db.add(job)
+        await db.flush()
+        await db.execute(
+            insert(BroadcastDelivery).from_select(
+                ["job_id", "user_id", "status"],
+                select(
+                    literal(job.id),
+                    User.id,
+                    literal(DeliveryStatus.PENDING.value),
+                ).where(User.is_active == True),
+            )
+        )
+        job.total = await db.scalar(
+            select(func.count()).where(BroadcastDelivery.job_id == job.id)
+        )
+        if not job.total:
+            # Отправлять некому: задание сразу завершено
+            job.status = BroadcastStatus.DONE.value
+            job.finished_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        await db.commit()
+        return job
+
+    @staticmethod
+    async def get_job(db: AsyncSession, job_id: int) -> Optional[BroadcastJob]:
+        return await db.get(BroadcastJob, job_id)
+
+    @staticmethod
+    async def get_next_job(db: AsyncSession) -> Optional[BroadcastJob]:
+        """Самое старое незавершенное задание"""
+        result = await db.execute(
+            select(BroadcastJob)
+            .where(
+                BroadcastJob.status.in_(
+                    [BroadcastStatus.PENDING.value, BroadcastStatus.RUNNING.value]
+                )
+            )
+            .order_by(BroadcastJob.id)
+            .limit(1)
+        )
+        return result.scalar_one_or_none()
+
+    @staticmethod
+    async def start_job(db: AsyncSession, job_id: int) -> Optional[BroadcastJob]:
+        """Перевести задание в статус running"""
+        job = await db.get(BroadcastJob, job_id)
+        if job:
+            job.status = BroadcastStatus.RUNNING.value
+            await db.commit()
+        return job
+
+    @staticmethod
+    async def finish_job(db: AsyncSession, job_id: int) -> Optional[BroadcastJob]:
+        """Завершить задание и вернуть его с итоговыми счетчиками"""
+        await BroadcastRepository._refresh_counters(db, job_id)
+        job = await db.get(BroadcastJob, job_id)
+        if job:
+            job.status = BroadcastStatus.DONE.value
+            job.finished_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        await db.commit()
+        if job:
+            await db.refresh(job)
+        return job
+
+    DISPATCHER_LOCK_KEY = 7_301_002
+
+    @staticmethod
+    async def try_lock_dispatcher(conn: AsyncConnection) -> bool:
+        """Взять блокировку диспетчера рассылок на время жизни соединения
+
+        Возвращает False, если рассылки отправляет другой процесс.
+        SQLite принадлежит одному хосту, там блокировка не нужна.
+        """
+        if conn.dialect.name != "postgresql":
+            return True
+        locked = await conn.scalar(
+            select(func.pg_try_advisory_lock(BroadcastRepository.DISPATCHER_LOCK_KEY))
+        )
+        await conn.commit()
+        return bool(locked)
+
+    @staticmethod
+    async def unlock_dispatcher(conn: AsyncConnection) -> None:
+        """Отпустить блокировку диспетчера (соединение возвращается в пул)"""
+        if conn.dialect.name != "postgresql":
+            return
+        await conn.scalar(
+            select(func.pg_advisory_unlock(BroadcastRepository.DISPATCHER_LOCK_KEY))
+        )
+        await conn.commit()
+
+    @staticmethod
+    async def recover_interrupted(db: AsyncSession) -> int:
+        """Пометить неудачными доставки, прерванные остановкой бота
+
+        Такие сообщения могли уже уйти, поэтому повторно они не отправляются.
+        Вызывается только под блокировкой диспетчера: пока она взята,
+        никто другой не отправляет рассылки, и все строки sending брошены.
+        """
+        result = await db.execute(
+            update(BroadcastDelivery)
+            .where(BroadcastDelivery.status == DeliveryStatus.SENDING.value)
+            .values(status=DeliveryStatus.FAILED.value, error="interrupted")
+            .returning(BroadcastDelivery.job_id)
+        )
+        job_ids = set(result.scalars().all())
+        for job_id in job_ids:
+            await BroadcastRepository._refresh_counters(db, job_id)
+        await db.commit()
+        return len(job_ids)
+
+    @staticmethod
+    async def claim_batch(db: AsyncSession, job_id: int, limit: int) -> List[int]:
+        """Взять следующую пачку получателей и пометить ее как отправляемую
+
+        Статус sending фиксируется до отправки: после сбоя эти получатели
+        не получат сообщение повторно. Пачка берется атомарно: UPDATE
+        меняет только строки, которые еще pending, поэтому два процесса
+        не возьмут одного получателя.
+        """
+        pending = (
+            select(BroadcastDelivery.user_id)
+            .where(
+                BroadcastDelivery.job_id == job_id,
+                BroadcastDelivery.status == DeliveryStatus.PENDING.value,
+            )
+            .order_by(BroadcastDelivery.user_id)
+            .limit(limit)
+        )
+        claim = update(BroadcastDelivery).where(
+            BroadcastDelivery.job_id == job_id,
+            BroadcastDelivery.status == DeliveryStatus.PENDING.value,
+        )
+
+        if db.get_bind().dialect.name == "postgresql":
+            # Строки, которые сейчас берет другой процесс, пропускаются
+            result = await db.execute(
+                claim.where(
+                    BroadcastDelivery.user_id.in_(
+                        pending.with_for_update(skip_locked=True).scalar_subquery()
+                    )
+                )
+                .values(status=DeliveryStatus.SENDING.value)
+                .returning(BroadcastDelivery.user_id)
+            )
+            user_ids = sorted(result.scalars().all())
+        else:
+            # Без SKIP LOCKED: помечаем пачку своей меткой и перечитываем,
+            # какие строки достались именно нам
+            candidates = list((await db.execute(pending)).scalars().all())
+            if not candidates:
+                return []
+            token = uuid.uuid4().hex
+            await db.execute(
+                claim.where(BroadcastDelivery.user_id.in_(candidates)).values(
+                    status=DeliveryStatus.SENDING.value, claimed_by=token
+                )
+            )
+            result = await db.execute(
+                select(BroadcastDelivery.user_id)
+                .where(
+                    BroadcastDelivery.job_id == job_id,
+                    BroadcastDelivery.claimed_by == token,
+                )
+                .order_by(BroadcastDelivery.user_id)
+            )
+            user_ids = list(result.scalars().all())
+        await db.commit()
+        return user_ids
+
+    @staticmethod
+    async def release(db: AsyncSession, job_id: int, user_ids: List[int]) -> None:
+        """Вернуть в очередь получателей, отправка которым не начиналась"""
+        if user_ids:
+            await db.execute(
+                update(BroadcastDelivery)
+                .where(
+                    BroadcastDelivery.job_id == job_id,
+                    BroadcastDelivery.user_id.in_(user_ids),
+                    BroadcastDelivery.status == DeliveryStatus.SENDING.value,
+                )
+                .values(status=DeliveryStatus.PENDING.value)
+            )
+        await db.commit()
+
+    @staticmethod
+    async def record_results(
+        db: AsyncSession, job_id: int, sent: List[int], failed: Dict[int, str]
+    ) -> None:
+        """Сохранить результаты отправки и обновить счетчики задания"""
+        if sent:
+            await db.execute(
+                update(BroadcastDelivery)
+                .where(
+                    BroadcastDelivery.job_id == job_id,
+                    BroadcastDelivery.user_id.in_(sent),
+                )
+                .values(status=DeliveryStatus.SENT.value)
+            )
+        # Ошибки обычно однотипные: один UPDATE на каждый текст ошибки
+        by_error: Dict[str, List[int]] = {}
+        for user_id, error in failed.items():
+            by_error.setdefault(error[:255], []).append(user_id)
+        for error, user_ids in by_error.items():
+            await db.execute(
+                update(BroadcastDelivery)
+                .where(
+                    BroadcastDelivery.job_id == job_id,
+                    BroadcastDelivery.user_id.in_(user_ids),
+                )
+                .values(status=DeliveryStatus.FAILED.value, error=error)
+            )
+        await BroadcastRepository._refresh_counters(db, job_id)
+        await db.commit()
+
+    @staticmethod
+    async def _refresh_counters(db: AsyncSession, job_id: int) -> None:
+        """Пересчитать sent/failed задания по строкам доставки"""
+
+        def count(status: DeliveryStatus):
+            return (
+                select(func.count())
+                .where(
+                    BroadcastDelivery.job_id == job_id,
+                    BroadcastDelivery.status == status.value,
+                )
+                .scalar_subquery()
+            )
+
+        await db.execute(
+            update(BroadcastJob)
+            .where(BroadcastJob.id == job_id)
+            .values(sent=count(DeliveryStatus.SENT), failed=count(DeliveryStatus.FAILED))
+            .execution_options(synchronize_session=False)
+        )
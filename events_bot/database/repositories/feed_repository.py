@@ -0,0 +1,101 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, and_, or_, func, delete, insert
+from typing import List
+from ..models import (
+    Post,
+    post_categories,
+    post_cities,
+    user_categories,
+    user_cities,
+    user_feed,
+)
+
+
+class FeedRepository:
+    """Репозиторий материализованной ленты пользователей (таблица user_feed)
+
+    Методы инкрементального обновления не делают commit: изменения ленты
+    фиксируются в той же транзакции, что и изменение поста или предпочтений
+    пользователя.
+    """
+
+    @staticmethod
+    def _matching_rows():
+        """Пары (пользователь, пост), совпадающие и по категориям, и по вузам"""
+        return (
+            select(user_categories.c.user_id, Post.id, Post.event_at)
+            .distinct()
+            .select_from(Post)
+            .join(post_categories, post_categories.c.post_id == Post.id)
+            .join(
+                user_categories,
+                user_categories.c.category_id == post_categories.c.category_id,
+            )
+            .join(post_cities, post_cities.c.post_id == Post.id)
+            .join(
+                user_cities,
+                and_(
+                    user_cities.c.city_id == post_cities.c.city_id,
+                    user_cities.c.user_id == user_categories.c.user_id,
+                ),
+            )
+            .where(Post.is_approved == True, Post.is_published == True)
+        )
+
+    @staticmethod
+    async def add_post(db: AsyncSession, post_id: int) -> None:
+        """Разложить опубликованный пост по лентам подходящих пользователей"""
+        # Флаги публикации могли быть изменены на ORM-объекте и еще не записаны
+        await db.flush()
+        await db.execute(delete(user_feed).where(user_feed.c.post_id == post_id))
+        await db.execute(
+            insert(user_feed).from_select(
+                ["user_id", "post_id", "event_at"],
+                FeedRepository._matching_rows().where(Post.id == post_id),
+            )
+        )
+
+    @staticmethod
+    async def remove_posts(db: AsyncSession, post_ids: List[int]) -> None:
+        """Убрать посты из всех лент"""
+        if post_ids:
+            await db.execute(delete(user_feed).where(user_feed.c.post_id.in_(post_ids)))
+
+    @staticmethod
+    async def rebuild_for_user(db: AsyncSession, user_id: int) -> None:
+        """Пересобрать ленту пользователя после смены категорий или вузов"""
+        await db.execute(delete(user_feed).where(user_feed.c.user_id == user_id))
+        await db.execute(
+            insert(user_feed).from_select(
+                ["user_id", "post_id", "event_at"],
+                FeedRepository._matching_rows().where(
+                    user_categories.c.user_id == user_id,
+                    or_(Post.event_at.is_(None), Post.event_at > func.now()),
+                ),
+            )
+        )
+
+    @staticmethod
+    async def remove_user(db: AsyncSession, user_id: int) -> None:
+        """Удалить ленту пользователя"""
+        await db.execute(delete(user_feed).where(user_feed.c.user_id == user_id))
+
+    @staticmethod
+    async def rebuild_all(db: AsyncSession) -> None:
+        """Полностью пересобрать материализованную ленту (заполнение после миграции)"""
+        await db.execute(delete(user_feed))
+        await db.execute(
+            insert(user_feed).from_select(
+                ["user_id", "post_id", "event_at"],
+                FeedRepository._matching_rows().where(
+                    or_(Post.event_at.is_(None), Post.event_at > func.now())
+                ),
+            )
+        )
+        await db.commit()
+
+    @staticmethod
+    async def is_empty(db: AsyncSession) -> bool:
+        """Пуста ли материализованная лента"""
+        result = await db.execute(select(user_feed.c.post_id).limit(1))
+        return result.first() is None
@@ -1,25 +1,40 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, delete
+from sqlalchemy import select, and_, delete, update, func, insert
+from sqlalchemy.exc import IntegrityError
 from typing import List, Optional
 from ..models import Like, User, Post
 
 
 class LikeRepository:
-    """Репозиторий для работы с лайками"""
+    """Репозиторий для работы с лайками
+
+    Количество лайков хранится в Post.likes_count и меняется в той же
+    транзакции, что и строка в likes.
+    """
+
+    @staticmethod
+    async def _change_likes_count(db: AsyncSession, post_id: int, delta: int) -> None:
+        """Изменить счетчик лайков поста без commit"""
+        await db.execute(
+            update(Post)
+            .where(Post.id == post_id)
+            .values(likes_count=Post.likes_count + delta)
+        )
 
     @staticmethod
     async def add_like(db: AsyncSession, user_id: int, post_id: int) -> Like:
         """Добавить лайк пользователя на пост"""
         # Проверяем, есть ли уже лайк от этого пользователя на этот пост
         existing_like = await LikeRepository.get_user_like(db, user_id, post_id)
-        
+
         if existing_like:
             # Если лайк уже есть, возвращаем существующий
             return existing_like
         else:
-            # Если лайка нет, создаём новый
+            # Если лайка нет, создаём новый и увеличиваем счетчик
             like = Like(user_id=user_id, post_id=post_id)
             db.add(like)
+            await LikeRepository._change_likes_count(db, post_id, 1)
             await db.commit()
             await db.refresh(like)
             return like
@@ -31,8 +46,11 @@ class LikeRepository:
             and_(Like.user_id == user_id, Like.post_id == post_id)
         )
         result = await db.execute(stmt)
+        removed = result.rowcount > 0
+        if removed:
+            await LikeRepository._change_likes_count(db, post_id, -1)
         await db.commit()
-        return result.rowcount > 0
+        return removed
 
     @staticmethod
     async def get_user_like(
@@ -55,9 +73,8 @@ class LikeRepository:
     @staticmethod
     async def get_post_likes_count(db: AsyncSession, post_id: int) -> int:
         """Получить количество лайков на пост"""
-        stmt = select(Like).where(Like.post_id == post_id)
-        result = await db.execute(stmt)
-        return len(result.scalars().all())
+        result = await db.execute(select(Post.likes_count).where(Post.id == post_id))
+        return result.scalar_one_or_none() or 0
 
     @staticmethod
     async def get_user_likes(db: AsyncSession, user_id: int) -> List[Like]:
@@ -66,24 +83,94 @@ class LikeRepository:
         result = await db.execute(stmt)
         return result.scalars().all()
 
+    @staticmethod
+    async def _insert_like_ignore(db: AsyncSession, user_id: int, post_id: int) -> bool:
+        """Вставить лайк, если его еще нет; True, если строка вставлена"""
+        dialect = db.get_bind().dialect.name
+        if dialect in ("postgresql", "sqlite"):
+            if dialect == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            inserted = await db.execute(
+                dialect_insert(Like)
+                .values(user_id=user_id, post_id=post_id)
+                .on_conflict_do_nothing(index_elements=["user_id", "post_id"])
+                .returning(Like.id)
+            )
+            return inserted.first() is not None
+
+        # Другие диалекты: обычный INSERT в точке сохранения, нарушение
+        # уникальности значит, что параллельное нажатие уже вставило лайк
+        try:
+            async with db.begin_nested():
+                await db.execute(insert(Like).values(user_id=user_id, post_id=post_id))
+        except IntegrityError:
+            return False
+        return True
+
+    @staticmethod
+    async def _update_likes_count(db: AsyncSession, post_id: int, delta: int) -> int:
+        """Изменить счетчик лайков поста без commit и вернуть новое значение"""
+        stmt = (
+            update(Post)
+            .where(Post.id == post_id)
+            .values(likes_count=Post.likes_count + delta)
+            .execution_options(synchronize_session=False)
+        )
+        if db.get_bind().dialect.name in ("postgresql", "sqlite"):
+            result = await db.execute(stmt.returning(Post.likes_count))
+            return result.scalar_one_or_none() or 0
+        await db.execute(stmt)
+        result = await db.execute(select(Post.likes_count).where(Post.id == post_id))
+        return result.scalar_one_or_none() or 0
+
     @staticmethod
     async def toggle_like(db: AsyncSession, user_id: int, post_id: int) -> dict:
-        """Переключить лайк пользователя на пост"""
-        existing_like = await LikeRepository.get_user_like(db, user_id, post_id)
-        
-        if existing_like:
-            # Если лайк уже есть - удаляем его
-            await LikeRepository.remove_like(db, user_id, post_id)
-            action = "removed"
+        """Переключить лайк пользователя на пост одной транзакцией
+
+        Сначала лайк удаляется, если удалять нечего — вставляется
+        (INSERT ... ON CONFLICT DO NOTHING, в других диалектах INSERT
+        с перехватом нарушения уникальности). Счетчик поста меняется
+        на фактически удаленную или вставленную строку, поэтому повторные
+        быстрые нажатия не сбивают ни состояние, ни количество.
+        """
+        deleted = await db.execute(
+            delete(Like).where(and_(Like.user_id == user_id, Like.post_id == post_id))
+        )
+        if deleted.rowcount > 0:
+            action, delta = "removed", -1
         else:
-            # Если лайка нет - добавляем
-            await LikeRepository.add_like(db, user_id, post_id)
+            inserted = await LikeRepository._insert_like_ignore(db, user_id, post_id)
+            # Не вставлено, если параллельное нажатие уже вставило этот лайк
+            delta = 1 if inserted else 0
             action = "added"
-        
-        # Получаем обновленное количество лайков
-        likes_count = await LikeRepository.get_post_likes_count(db, post_id)
-        
+
+        likes_count = await LikeRepository._update_likes_count(db, post_id, delta)
+        await db.commit()
+
         return {
             "action": action,
-            "likes_count": likes_count
-        } 
\ No newline at end of file
+            "is_liked": action == "added",
+            "likes_count": likes_count,
+        }
+
+    @staticmethod
+    async def reconcile_likes_count(db: AsyncSession) -> int:
+        """Исправить расхождения Post.likes_count с таблицей likes
+
+        Возвращает количество исправленных постов.
+        """
+        actual = (
+            select(func.count(Like.id))
+            .where(Like.post_id == Post.id)
+            .scalar_subquery()
+        )
+        result = await db.execute(
+            update(Post)
+            .where(Post.likes_count != actual)
+            .values(likes_count=actual)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        return result.rowcount or 0
@@ -1,10 +1,53 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, func, insert, or_, delete
+from sqlalchemy import select, and_, func, insert, or_, delete, exists, update, text, false
 from sqlalchemy.orm import selectinload
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from datetime import datetime, timezone
 from ..models import Post, ModerationRecord, ModerationAction, Category, City, post_categories
-from ..models import User, Like
+from ..models import User, Like, post_cities, user_feed, PendingImage
+from sqlalchemy.exc import IntegrityError
+from .feed_repository import FeedRepository
+from ...utils.pagination import decode_cursor
+
+
+def apply_keyset(stmt, event_col, id_col, cursor: str | None = None, direction: str = "next"):
+    """Добавить к запросу keyset-условие и сортировку по (event_at, id)
+
+    Порядок ленты: по возрастанию event_at, посты без даты — в конце,
+    при равных датах — по id.
+
+    Args:
+        cursor: курсор из encode_cursor или None для первой страницы
+        direction: "next" — строго после курсора, "prev" — строго до курсора,
+            "at" — начиная с курсора включительно
+    """
+    if direction == "prev":
+        stmt = stmt.order_by(event_col.desc().nulls_first(), id_col.desc())
+    else:
+        stmt = stmt.order_by(event_col.asc().nulls_last(), id_col.asc())
+    if not cursor:
+        return stmt
+
+    event_at, last_id = decode_cursor(cursor)
+    if direction == "prev":
+        if event_at is None:
+            condition = or_(event_col.is_not(None), id_col < last_id)
+        else:
+            condition = and_(
+                event_col.is_not(None),
+                or_(event_col < event_at, and_(event_col == event_at, id_col < last_id)),
+            )
+    else:
+        id_condition = id_col >= last_id if direction == "at" else id_col > last_id
+        if event_at is None:
+            condition = and_(event_col.is_(None), id_condition)
+        else:
+            condition = or_(
+                event_col > event_at,
+                and_(event_col == event_at, id_condition),
+                event_col.is_(None),
+            )
+    return stmt.where(condition)
 
 
 class PostRepository:
@@ -22,6 +65,7 @@ class PostRepository:
         event_at: datetime | None = None,
         url: str | None = None,
         address: str | None = None,
+        tg_file_id: str | None = None,
     ) -> Post:
         """Создать новый пост с категориями, городами и адресом"""
         categories_result = await db.execute(
@@ -39,6 +83,7 @@ class PostRepository:
             content=content,
             author_id=author_id,
             image_id=image_id,
+            tg_file_id=tg_file_id,
             event_at=event_at,
             url=url,
             address=address,
@@ -112,6 +157,7 @@ class PostRepository:
                 comment=comment,
             )
             db.add(moderation_record)
+            await FeedRepository.add_post(db, post_id)
             await db.commit()
             await db.refresh(post)
         return post
@@ -132,6 +178,7 @@ class PostRepository:
                 comment=comment,
             )
             db.add(moderation_record)
+            await FeedRepository.remove_posts(db, [post_id])
             await db.commit()
             await db.refresh(post)
         return post
@@ -179,161 +226,282 @@ class PostRepository:
         if post:
             post.is_published = True
             post.published_at = func.now()
+            await FeedRepository.add_post(db, post_id)
             await db.commit()
             await db.refresh(post)
         return post
 
     @staticmethod
-    async def get_feed_posts(
-        db: AsyncSession, user_id: int, limit: int = 10, offset: int = 0
-    ) -> List[Post]:
-        user_result = await db.execute(
-            select(User)
-            .where(User.id == user_id)
-            .options(selectinload(User.categories), selectinload(User.cities))
+    async def set_tg_file_id(db: AsyncSession, post_id: int, tg_file_id: str) -> None:
+        """Запомнить file_id фото поста в Telegram, если он еще не сохранен"""
+        await db.execute(
+            update(Post)
+            .where(Post.id == post_id, Post.tg_file_id.is_(None))
+            .values(tg_file_id=tg_file_id)
+            .execution_options(synchronize_session=False)
         )
-        user = user_result.scalar_one_or_none()
-        if not user or not user.categories or not user.cities:
-            return []
+        await db.commit()
 
-        category_ids = [cat.id for cat in user.categories]
-        city_ids = [c.id for c in user.cities]
-        now_utc = func.now()
-        
-        result = await db.execute(
-            select(Post)
-            .group_by(Post.id) # <-- ИЗМЕНЕНИЕ ЗДЕСЬ
-            .join(Post.categories)
-            .join(Post.cities)
-            .where(
-                and_(
-                    Post.categories.any(Category.id.in_(category_ids)),
-                    Post.cities.any(City.id.in_(city_ids)),
-                    Post.is_approved == True,
-                    Post.is_published == True,
-                    or_(Post.event_at.is_(None), Post.event_at > now_utc),
-                )
-            )
-            .options(selectinload(Post.author), selectinload(Post.categories), selectinload(Post.cities))
-            .order_by(Post.event_at.is_(None), Post.event_at.asc())
+    @staticmethod
+    def _feed_source(user_id: int):
+        """Лента пользователя: диапазон индекса user_feed (user_id, event_at, post_id)"""
+        return select(
+            user_feed.c.post_id.label("post_id"),
+            user_feed.c.event_at.label("event_at"),
+        ).where(
+            user_feed.c.user_id == user_id,
+            or_(user_feed.c.event_at.is_(None), user_feed.c.event_at > func.now()),
+        )
+
+    @staticmethod
+    def _liked_source(user_id: int):
+        """Избранное пользователя: актуальные посты с его лайком"""
+        return select(
+            Post.id.label("post_id"),
+            Post.event_at.label("event_at"),
+        ).where(
+            exists().where(Like.post_id == Post.id, Like.user_id == user_id),
+            Post.is_approved == True,
+            Post.is_published == True,
+            or_(Post.event_at.is_(None), Post.event_at > func.now()),
+        )
+
+    @staticmethod
+    async def _get_page(
+        db: AsyncSession,
+        source,
+        limit: int,
+        cursor: str | None,
+        direction: str,
+    ) -> Tuple[List[Post], int]:
+        """Страница постов и общее число подходящих постов одним запросом
+
+        source — запрос с колонками post_id и event_at. Общее число считается
+        оконной функцией COUNT(*) OVER () в CTE до применения курсора, поэтому
+        оно не зависит от текущей страницы. Категории постов подгружаются
+        вторым запросом (selectinload). Для пустой страницы общее число
+        неизвестно и возвращается 0.
+        """
+        source = source.add_columns(func.count().over().label("total")).cte("page_source")
+        stmt = (
+            select(Post, source.c.total)
+            .join(source, source.c.post_id == Post.id)
+            .options(selectinload(Post.categories))
             .limit(limit)
-            .offset(offset)
         )
-        return result.scalars().all()
+        stmt = apply_keyset(stmt, source.c.event_at, source.c.post_id, cursor, direction)
+        rows = (await db.execute(stmt)).all()
+        posts = [row[0] for row in rows]
+        total = rows[0][1] if rows else 0
+        if direction == "prev":
+            posts.reverse()
+        return posts, total
 
     @staticmethod
-    async def get_feed_posts_count(db: AsyncSession, user_id: int) -> int:
-        user_result = await db.execute(
-            select(User)
-            .where(User.id == user_id)
-            .options(selectinload(User.categories), selectinload(User.cities))
+    async def get_feed_page(
+        db: AsyncSession,
+        user_id: int,
+        limit: int = 10,
+        cursor: str | None = None,
+        direction: str = "next",
+    ) -> Tuple[List[Post], int]:
+        """Страница ленты пользователя и общее число постов в ленте"""
+        return await PostRepository._get_page(
+            db, PostRepository._feed_source(user_id), limit, cursor, direction
         )
-        user = user_result.scalar_one_or_none()
-        if not user or not user.categories or not user.cities:
-            return 0
 
-        category_ids = [cat.id for cat in user.categories]
-        city_ids = [c.id for c in user.cities]
+    @staticmethod
+    async def get_feed_posts(
+        db: AsyncSession,
+        user_id: int,
+        limit: int = 10,
+        cursor: str | None = None,
+        direction: str = "next",
+    ) -> List[Post]:
+        """Страница ленты пользователя (keyset-пагинация по (event_at, id))"""
+        posts, _ = await PostRepository.get_feed_page(db, user_id, limit, cursor, direction)
+        return posts
 
+    @staticmethod
+    async def get_feed_posts_count(db: AsyncSession, user_id: int) -> int:
         result = await db.execute(
-            select(func.count(Post.id.distinct()))
-            .join(Post.categories)
-            .join(Post.cities)
-            .where(
-                and_(
-                    Post.categories.any(Category.id.in_(category_ids)),
-                    Post.cities.any(City.id.in_(city_ids)),
-                    Post.is_approved == True,
-                    Post.is_published == True,
-                    or_(Post.event_at.is_(None), Post.event_at > func.now()),
-                )
-            )
+            select(func.count()).select_from(PostRepository._feed_source(user_id).subquery())
         )
         return result.scalar() or 0
 
+    @staticmethod
+    async def get_liked_page(
+        db: AsyncSession,
+        user_id: int,
+        limit: int = 10,
+        cursor: str | None = None,
+        direction: str = "next",
+    ) -> Tuple[List[Post], int]:
+        """Страница избранного пользователя и общее число избранных постов"""
+        return await PostRepository._get_page(
+            db, PostRepository._liked_source(user_id), limit, cursor, direction
+        )
+
     @staticmethod
     async def get_liked_posts(
-        db: AsyncSession, user_id: int, limit: int = 10, offset: int = 0
+        db: AsyncSession,
+        user_id: int,
+        limit: int = 10,
+        cursor: str | None = None,
+        direction: str = "next",
     ) -> List[Post]:
-        from ..models import Like
-        result = await db.execute(
-            select(Post)
-            .join(Like, Like.post_id == Post.id)
-            .where(
-                and_(
-                    Like.user_id == user_id,
-                    Post.is_approved == True,
-                    Post.is_published == True,
-                    or_(Post.event_at.is_(None), Post.event_at > func.now()),
-                )
-            )
-            .options(selectinload(Post.author), selectinload(Post.categories), selectinload(Post.cities))
-            .order_by(Post.event_at.is_(None), Post.event_at.asc())
-            .limit(limit)
-            .offset(offset)
-        )
-        return result.scalars().all()
+        """Страница избранного пользователя (keyset-пагинация по (event_at, id))"""
+        posts, _ = await PostRepository.get_liked_page(db, user_id, limit, cursor, direction)
+        return posts
 
     @staticmethod
     async def get_liked_posts_count(db: AsyncSession, user_id: int) -> int:
-        from ..models import Like
         result = await db.execute(
-            select(func.count(Post.id))
-            .join(Like, Like.post_id == Post.id)
-            .where(
-                and_(
-                    Like.user_id == user_id,
-                    Post.is_approved == True,
-                    Post.is_published == True,
-                    or_(Post.event_at.is_(None), Post.event_at > func.now()),
+            select(func.count()).select_from(PostRepository._liked_source(user_id).subquery())
+        )
+        return result.scalar() or 0
+
+    # Ключ advisory-блокировки очистки просроченных постов (PostgreSQL)
+    EXPIRED_CLEANUP_LOCK_KEY = 7_301_001
+
+    @staticmethod
+    async def try_lock_expired_cleanup(db: AsyncSession) -> bool:
+        """Взять блокировку очистки до конца текущей транзакции
+
+        Возвращает False, если очистку сейчас выполняет другой процесс.
+        SQLite принадлежит одному хосту, там блокировка не нужна.
+        """
+        if db.get_bind().dialect.name != "postgresql":
+            return True
+        return bool(
+            await db.scalar(
+                select(
+                    func.pg_try_advisory_xact_lock(
+                        PostRepository.EXPIRED_CLEANUP_LOCK_KEY
+                    )
                 )
             )
         )
-        return result.scalar() or 0
 
     @staticmethod
-    async def delete_expired_posts(db: AsyncSession) -> int:
+    async def delete_expired_posts(
+        db: AsyncSession, now: datetime, limit: int
+    ) -> List[Tuple[int, Optional[str]]]:
+        """Удалить до limit прошедших мероприятий без commit
+
+        Возвращает (id, image_id) удаленных постов.
+        """
         from ..models import Like, ModerationRecord, post_cities
-        current_utc = datetime.now(timezone.utc).replace(tzinfo=None)
-        expired_posts = await db.execute(
-            select(Post.id).where(
-                Post.event_at.is_not(None), Post.event_at <= current_utc
-            )
+        expired = await db.execute(
+            select(Post.id)
+            .where(Post.event_at.is_not(None), Post.event_at <= now)
+            .order_by(Post.event_at, Post.id)
+            .limit(limit)
         )
-        post_ids = [pid for pid in expired_posts.scalars().all()]
+        post_ids = list(expired.scalars().all())
         if not post_ids:
-            return 0
-        await db.execute(Like.__table__.delete().where(Like.post_id.in_(post_ids)))
+            return []
+        await FeedRepository.remove_posts(db, post_ids)
+        await db.execute(delete(Like).where(Like.post_id.in_(post_ids)))
         await db.execute(
-            ModerationRecord.__table__.delete().where(
-                ModerationRecord.post_id.in_(post_ids)
-            )
+            delete(ModerationRecord).where(ModerationRecord.post_id.in_(post_ids))
         )
         await db.execute(
-            post_categories.delete().where(post_categories.c.post_id.in_(post_ids))
+            delete(post_categories).where(post_categories.c.post_id.in_(post_ids))
         )
-        await db.execute(
-            post_cities.delete().where(post_cities.c.post_id.in_(post_ids))
+        await db.execute(delete(post_cities).where(post_cities.c.post_id.in_(post_ids)))
+        result = await db.execute(
+            delete(Post)
+            .where(Post.id.in_(post_ids))
+            .returning(Post.id, Post.image_id)
+            .execution_options(synchronize_session=False)
         )
-        result = await db.execute(Post.__table__.delete().where(Post.id.in_(post_ids)))
-        await db.commit()
-        return result.rowcount or 0
+        return [(row.id, row.image_id) for row in result.all()]
+
+    @staticmethod
+    async def get_used_image_ids(db: AsyncSession, image_ids: List[str]) -> set[str]:
+        """Какие из картинок еще используются постами или незавершенными загрузками
+
+        Одинаковые загрузки хранятся одним файлом, поэтому картинка
+        удаленного поста может принадлежать и другому.
+        """
+        if not image_ids:
+            return set()
+        result = await db.execute(
+            select(Post.image_id)
+            .where(Post.image_id.in_(image_ids))
+            .union(select(PendingImage.image_id).where(PendingImage.image_id.in_(image_ids)))
+        )
+        return set(result.scalars().all())
 
     @staticmethod
-    async def get_expired_posts_info(db: AsyncSession) -> list[dict]:
-        current_utc = datetime.now(timezone.utc).replace(tzinfo=None)
+    async def lock_pending_images(db: AsyncSession) -> None:
+        """Запретить новые загрузки картинок до конца текущей транзакции
+
+        Между проверкой, что файл не используется, и его удалением никто
+        не должен успеть взять этот файл для нового поста.
+        """
+        if db.get_bind().dialect.name == "postgresql":
+            await db.execute(text("LOCK TABLE pending_images IN SHARE MODE"))
+        else:
+            # SQLite: любая запись держит блокировку базы до конца транзакции
+            await db.execute(delete(PendingImage).where(false()))
+
+    @staticmethod
+    async def hold_pending_image(db: AsyncSession, image_id: str, now: datetime) -> None:
+        """Записать (или продлить) незавершенную загрузку картинки без commit"""
         result = await db.execute(
-            select(Post.id, Post.image_id).where(
-                and_(Post.event_at.is_not(None), Post.event_at <= current_utc)
+            update(PendingImage)
+            .where(PendingImage.image_id == image_id)
+            .values(created_at=now)
+        )
+        if result.rowcount:
+            return
+        try:
+            async with db.begin_nested():
+                db.add(PendingImage(image_id=image_id, created_at=now))
+        except IntegrityError:
+            # Ту же картинку одновременно загрузил кто-то еще
+            await db.execute(
+                update(PendingImage)
+                .where(PendingImage.image_id == image_id)
+                .values(created_at=now)
             )
+
+    @staticmethod
+    async def delete_expired_pending_images(
+        db: AsyncSession, before: datetime, limit: int
+    ) -> List[str]:
+        """Удалить до limit записей загрузок старше before без commit, вернуть их ключи"""
+        result = await db.execute(
+            select(PendingImage.image_id)
+            .where(PendingImage.created_at < before)
+            .order_by(PendingImage.created_at)
+            .limit(limit)
+        )
+        image_ids = list(result.scalars().all())
+        if image_ids:
+            await db.execute(
+                delete(PendingImage).where(
+                    PendingImage.image_id.in_(image_ids),
+                    PendingImage.created_at < before,
+                )
+            )
+        return image_ids
+
+    @staticmethod
+    async def get_next_event_at(db: AsyncSession) -> Optional[datetime]:
+        """Ближайшая дата мероприятия среди всех постов"""
+        return await db.scalar(
+            select(func.min(Post.event_at)).where(Post.event_at.is_not(None))
         )
-        rows = result.all()
-        return [{"id": row[0], "image_id": row[1]} for row in rows]
 
     @staticmethod
     async def delete_post(db: AsyncSession, post_id: int) -> bool:
         """Полное удаление поста по ID"""
         from ..models import Like, ModerationRecord, post_cities
+        # Убираем пост из лент пользователей
+        await FeedRepository.remove_posts(db, [post_id])
         # Удаляем лайки
         await db.execute(delete(Like).where(Like.post_id == post_id))
         # Удаляем записи модерации
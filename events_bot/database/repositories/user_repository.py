@@ -1,9 +1,10 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, delete, insert
+from sqlalchemy import select, and_, delete, insert, update, func, Row
 from sqlalchemy.orm import selectinload
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional, Tuple
 from ..models import User, Category, City, user_categories, user_cities, post_cities
 from ..models import Post, Like, ModerationRecord, post_categories
+from .feed_repository import FeedRepository
 
 
 class UserRepository:
@@ -46,6 +47,10 @@ class UserRepository:
             user = await UserRepository.create_user(
                 db, telegram_id, username, first_name, last_name
             )
+        elif not user.is_active:
+            # Пользователь снова пишет боту — значит, чат доступен
+            user.is_active = True
+            await db.commit()
         return user
 
     @staticmethod
@@ -61,6 +66,7 @@ class UserRepository:
                 for category_id in category_ids
             ]
             await db.execute(insert(user_categories).values(values))
+        await FeedRepository.rebuild_for_user(db, user_id)
         await db.commit()
         result = await db.execute(
             select(User)
@@ -81,6 +87,7 @@ class UserRepository:
                 {"user_id": user_id, "city_id": city_id} for city_id in city_ids
             ]
             await db.execute(insert(user_cities).values(values))
+        await FeedRepository.rebuild_for_user(db, user_id)
         await db.commit()
         result = await db.execute(
             select(User).where(User.id == user_id).options(selectinload(User.cities))
@@ -97,11 +104,104 @@ class UserRepository:
             .join(User.cities)
             .join(User.categories)
             .where(
-                and_(City.id.in_(city_ids), Category.id.in_(category_ids))
+                and_(
+                    City.id.in_(city_ids),
+                    Category.id.in_(category_ids),
+                    User.is_active == True,
+                )
             )
         )
         return result.scalars().all()
 
+    @staticmethod
+    def _post_recipients_query(post_id: int):
+        """Получатели уведомления о посте: (user_id, is_liked)
+
+        Пользователи подбираются по категориям и вузам поста, лайк
+        присоединяется LEFT JOIN — все решается одним запросом.
+        """
+        return (
+            select(
+                user_categories.c.user_id,
+                Like.id.is_not(None).label("is_liked"),
+            )
+            .distinct()
+            .select_from(user_categories)
+            .join(
+                User,
+                and_(User.id == user_categories.c.user_id, User.is_active == True),
+            )
+            .join(
+                post_categories,
+                and_(
+                    post_categories.c.category_id == user_categories.c.category_id,
+                    post_categories.c.post_id == post_id,
+                ),
+            )
+            .join(user_cities, user_cities.c.user_id == user_categories.c.user_id)
+            .join(
+                post_cities,
+                and_(
+                    post_cities.c.city_id == user_cities.c.city_id,
+                    post_cities.c.post_id == post_id,
+                ),
+            )
+            .outerjoin(
+                Like,
+                and_(Like.user_id == user_categories.c.user_id, Like.post_id == post_id),
+            )
+        )
+
+    @staticmethod
+    async def get_post_recipients(
+        db: AsyncSession, post_id: int
+    ) -> List[Tuple[int, bool]]:
+        """Получатели уведомления о посте с признаком лайка"""
+        result = await db.execute(UserRepository._post_recipients_query(post_id))
+        return [(user_id, bool(is_liked)) for user_id, is_liked in result.all()]
+
+    @staticmethod
+    async def _iter_batches(
+        db: AsyncSession, stmt, id_col, batch_size: int
+    ) -> AsyncIterator[Row]:
+        """Читать запрос пачками по возрастанию id_col (keyset)
+
+        Между пачками читающая транзакция завершается: долгая рассылка
+        не держит соединение из пула и не блокирует запись в SQLite.
+        """
+        last_id = None
+        while True:
+            page = stmt.order_by(id_col).limit(batch_size)
+            if last_id is not None:
+                page = page.where(id_col > last_id)
+            rows = (await db.execute(page)).all()
+            await db.rollback()
+            for row in rows:
+                yield row
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1][0]
+
+    @staticmethod
+    async def iter_post_recipients(
+        db: AsyncSession, post_id: int, batch_size: int = 1000
+    ) -> AsyncIterator[Tuple[int, bool]]:
+        """Получатели уведомления о посте потоком: (user_id, is_liked)"""
+        async for user_id, is_liked in UserRepository._iter_batches(
+            db,
+            UserRepository._post_recipients_query(post_id),
+            user_categories.c.user_id,
+            batch_size,
+        ):
+            yield user_id, bool(is_liked)
+
+    @staticmethod
+    async def count_post_recipients(db: AsyncSession, post_id: int) -> int:
+        """Количество получателей уведомления о посте"""
+        subquery = UserRepository._post_recipients_query(post_id).subquery()
+        result = await db.execute(select(func.count()).select_from(subquery))
+        return result.scalar_one()
+
     @staticmethod
     async def delete_user(db: AsyncSession, user_id: int) -> bool:
         """Полное удаление пользователя (исправленная версия)"""
@@ -110,6 +210,13 @@ class UserRepository:
             return False # Пользователь не найден
 
         # 1. Удаляем все, что напрямую ссылается на пользователя (кроме постов)
+        await FeedRepository.remove_user(db, user_id)
+        await db.execute(
+            update(Post)
+            .where(Post.id.in_(select(Like.post_id).where(Like.user_id == user_id)))
+            .values(likes_count=Post.likes_count - 1)
+            .execution_options(synchronize_session=False)
+        )
         await db.execute(delete(Like).where(Like.user_id == user_id))
         await db.execute(delete(ModerationRecord).where(ModerationRecord.moderator_id == user_id))
         
@@ -119,6 +226,7 @@ class UserRepository:
         
         if post_ids:
             # 3. Удаляем все, что ссылается на его посты
+            await FeedRepository.remove_posts(db, post_ids)
             await db.execute(delete(Like).where(Like.post_id.in_(post_ids)))
             await db.execute(delete(ModerationRecord).where(ModerationRecord.post_id.in_(post_ids)))
             await db.execute(delete(post_categories).where(post_categories.c.post_id.in_(post_ids)))
@@ -137,6 +245,38 @@ class UserRepository:
         await db.commit()
         return True
 
+    @staticmethod
+    async def deactivate_users(db: AsyncSession, user_ids: List[int]) -> int:
+        """Пометить неактивными пользователей, до которых не доходят сообщения"""
+        if not user_ids:
+            return 0
+        result = await db.execute(
+            update(User)
+            .where(User.id.in_(user_ids), User.is_active == True)
+            .values(is_active=False)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        return result.rowcount or 0
+
+    @staticmethod
+    async def iter_user_ids(
+        db: AsyncSession, batch_size: int = 1000
+    ) -> AsyncIterator[int]:
+        """id всех активных пользователей потоком"""
+        async for (user_id,) in UserRepository._iter_batches(
+            db, select(User.id).where(User.is_active == True), User.id, batch_size
+        ):
+            yield user_id
+
+    @staticmethod
+    async def count_users(db: AsyncSession) -> int:
+        """Количество активных пользователей"""
+        result = await db.execute(
+            select(func.count(User.id)).where(User.is_active == True)
+        )
+        return result.scalar_one()
+
     # НОВЫЙ МЕТОД ДЛЯ РАССЫЛКИ
     @staticmethod
     async def get_all_users(db: AsyncSession) -> List[User]:
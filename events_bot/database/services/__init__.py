@@ -5,6 +5,7 @@ from .notification_service import NotificationService
 from .moderation_service import ModerationService
 from .like_service import LikeService
 from .city_service import CityService
+from .broadcast_service import BroadcastService
 
 __all__ = [
     "UserService",
@@ -14,4 +15,5 @@ __all__ = [
     "ModerationService",
     "LikeService",
     "CityService",
+    "BroadcastService",
 ]
@@ -0,0 +1,220 @@
+import asyncio
+import os
+from typing import Dict, List, Optional, Set
+
+import logfire
+from aiogram import Bot
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from ..connection import get_engine
+from ..repositories import BroadcastRepository, UserRepository
+from ..models import BroadcastJob
+from ...utils import get_fanout_engine, FanoutStats, is_unreachable_chat
+from ...bot.utils import get_db_session
+
+# Сколько получателей помечается отправляемыми за раз
+BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", "50"))
+# Как часто диспетчер проверяет очередь без явного пробуждения, секунды
+BROADCAST_POLL_INTERVAL = float(os.getenv("BROADCAST_POLL_INTERVAL", "30"))
+
+_wakeup: Optional[asyncio.Event] = None
+
+
+def _get_wakeup() -> asyncio.Event:
+    global _wakeup
+    if _wakeup is None:
+        _wakeup = asyncio.Event()
+    return _wakeup
+
+
+class BroadcastService:
+    """Сервис сохраняемых рассылок /broadcast
+
+    Задание и статус доставки каждому пользователю хранятся в базе.
+    Фоновый диспетчер отправляет задания по очереди через общий движок
+    рассылки и продолжает их после перезапуска бота.
+    """
+
+    @staticmethod
+    async def create_broadcast(
+        db: AsyncSession,
+        text: str,
+        created_by: int,
+        report_chat_id: Optional[int] = None,
+        report_message_id: Optional[int] = None,
+    ) -> BroadcastJob:
+        """Поставить рассылку в очередь и разбудить диспетчер"""
+        job = await BroadcastRepository.create_job(
+            db, text, created_by, report_chat_id, report_message_id
+        )
+        logfire.info(f"Создано задание рассылки {job.id} на {job.total} пользователей")
+        _get_wakeup().set()
+        return job
+
+    @staticmethod
+    def format_progress(job: BroadcastJob, sent: int, failed: int) -> str:
+        """Текст сообщения о прогрессе рассылки"""
+        processed = sent + failed
+        if processed >= job.total:
+            header = "✅ Рассылка завершена!\n" f"Всего пользователей: {job.total}\n"
+            footer = f"Отправленное сообщение:\n{job.text}"
+        else:
+            header = "⏳ Рассылка сообщения...\n" f"Прогресс: {processed}/{job.total}\n"
+            footer = job.text
+        return f"{header}Успешно: {sent}\nОшибок: {failed}\n\n{footer}"
+
+    @staticmethod
+    async def _report(bot: Bot, job: BroadcastJob, sent: int, failed: int) -> None:
+        if not job.report_chat_id or not job.report_message_id:
+            return
+        await bot.edit_message_text(
+            text=BroadcastService.format_progress(job, sent, failed),
+            chat_id=job.report_chat_id,
+            message_id=job.report_message_id,
+            parse_mode="HTML",
+        )
+
+    @staticmethod
+    async def run_job(bot: Bot, job_id: int) -> None:
+        """Отправить оставшихся получателей задания"""
+        async with get_db_session() as db:
+            job = await BroadcastRepository.start_job(db, job_id)
+            if not job:
+                return
+            base_sent, base_failed = job.sent, job.failed
+            logfire.info(
+                f"Рассылка {job.id}: осталось {job.total - base_sent - base_failed} из {job.total}"
+            )
+
+            sent: List[int] = []
+            failed: Dict[int, str] = {}
+            # Получатели, заблокировавшие бота или недоступные
+            unreachable: List[int] = []
+            # Взятые из очереди получатели и те, кому отправка уже началась
+            claimed: Set[int] = set()
+            started: Set[int] = set()
+
+            def on_done(user_id: int, error: Optional[Exception]) -> None:
+                claimed.discard(user_id)
+                started.discard(user_id)
+                if error is None:
+                    sent.append(user_id)
+                else:
+                    failed[user_id] = str(error) or type(error).__name__
+                    if is_unreachable_chat(error):
+                        unreachable.append(user_id)
+
+            async def flush() -> None:
+                if not sent and not failed:
+                    return
+                done_sent, done_failed = sent[:], dict(failed)
+                done_unreachable = unreachable[:]
+                sent.clear()
+                failed.clear()
+                unreachable.clear()
+                await BroadcastRepository.record_results(db, job.id, done_sent, done_failed)
+                if done_unreachable:
+                    await UserRepository.deactivate_users(db, done_unreachable)
+
+            async def recipients():
+                while True:
+                    await flush()
+                    batch = await BroadcastRepository.claim_batch(
+                        db, job.id, BROADCAST_BATCH_SIZE
+                    )
+                    if not batch:
+                        return
+                    claimed.update(batch)
+                    for user_id in batch:
+                        yield user_id
+
+            async def send(user_id: int) -> None:
+                started.add(user_id)
+                await bot.send_message(chat_id=user_id, text=job.text, parse_mode="HTML")
+
+            async def report(stats: FanoutStats) -> None:
+                # Итоговый отчет отправляется после сохранения результатов
+                if base_sent + base_failed + stats.processed < job.total:
+                    await BroadcastService._report(
+                        bot, job, base_sent + stats.sent, base_failed + stats.failed
+                    )
+
+            try:
+                await get_fanout_engine().run(
+                    recipients(),
+                    send,
+                    total=job.total - base_sent - base_failed,
+                    on_progress=report,
+                    on_done=on_done,
+                )
+            except asyncio.CancelledError:
+                # Остановка бота: сохраняем результаты, а неначатые отправки
+                # возвращаем в очередь. Прерванные на лету останутся в sending
+                # и после перезапуска будут помечены неудачными.
+                await flush()
+                await BroadcastRepository.release(db, job.id, list(claimed - started))
+                raise
+            await flush()
+
+            job = await BroadcastRepository.finish_job(db, job.id)
+            logfire.info(
+                f"Рассылка {job.id} завершена: успех={job.sent}, ошибок={job.failed}"
+            )
+            try:
+                await BroadcastService._report(bot, job, job.sent, job.failed)
+            except Exception as e:
+                logfire.warning(f"Не удалось обновить отчет рассылки {job.id}: {e}")
+
+    @staticmethod
+    async def run_dispatcher(bot: Bot) -> None:
+        """Фоновый диспетчер: выполняет задания рассылки по очереди
+
+        Рассылки отправляет один процесс на все реплики и воркеры: тот, кто
+        держит блокировку диспетчера. Остальные периодически пробуют ее
+        взять и подхватывают очередь, если держатель остановился.
+        """
+        while True:
+            try:
+                async with get_engine().connect() as lock_conn:
+                    if await BroadcastRepository.try_lock_dispatcher(lock_conn):
+                        try:
+                            await BroadcastService._dispatch(bot, lock_conn)
+                        finally:
+                            await BroadcastRepository.unlock_dispatcher(lock_conn)
+            except Exception as e:
+                logfire.error(f"Ошибка диспетчера рассылок: {e}")
+            await asyncio.sleep(BROADCAST_POLL_INTERVAL)
+
+    @staticmethod
+    async def _dispatch(bot: Bot, lock_conn: AsyncConnection) -> None:
+        """Цикл диспетчера под блокировкой; выходит, если соединение с блокировкой потеряно"""
+        logfire.info("Диспетчер рассылок работает в этом процессе")
+        try:
+            async with get_db_session() as db:
+                recovered = await BroadcastRepository.recover_interrupted(db)
+            if recovered:
+                logfire.warning(
+                    f"Прерванные отправки помечены неудачными, рассылок: {recovered}"
+                )
+        except Exception as e:
+            logfire.error(f"Ошибка восстановления рассылок: {e}")
+
+        wakeup = _get_wakeup()
+        while True:
+            wakeup.clear()
+            # Блокировка живет, пока живо ее соединение
+            await lock_conn.execute(select(1))
+            await lock_conn.commit()
+            try:
+                async with get_db_session() as db:
+                    job = await BroadcastRepository.get_next_job(db)
+                if job:
+                    await BroadcastService.run_job(bot, job.id)
+                    continue
+            except Exception as e:
+                logfire.error(f"Ошибка диспетчера рассылок: {e}")
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=BROADCAST_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
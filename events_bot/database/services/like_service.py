@@ -52,4 +52,9 @@ class LikeService:
     ) -> bool:
         """Проверить, поставил ли пользователь лайк на пост"""
         like = await LikeService.get_user_like(db, user_id, post_id)
-        return like is not None 
\ No newline at end of file
+        return like is not None 
+
+    @staticmethod
+    async def reconcile_likes_count(db: AsyncSession) -> int:
+        """Сверить счетчики лайков постов с таблицей likes"""
+        return await LikeRepository.reconcile_likes_count(db)
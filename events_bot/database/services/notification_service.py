@@ -1,12 +1,13 @@
-from typing import List
+from typing import AsyncIterable, AsyncIterator, Iterable, List, Optional, Tuple, Union
 import logfire
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from ..repositories import UserRepository
-from ..models import User, Post, Like
-from ...utils import get_clean_category_string
+from ..repositories import UserRepository, PostRepository
+from ..models import User, Post
+from ...utils import get_clean_category_string, get_fanout_engine, FanoutStats, is_unreachable_chat
+from ...utils.fanout import ProgressFunc
+from ...bot.utils import get_db_session
 from ...bot.keyboards.notification_keyboard import get_post_notification_keyboard
-from ...storage import file_storage
+from .post_service import PostService
 from aiogram import Bot
 
 
@@ -32,6 +33,22 @@ class NotificationService:
         )
         return users
 
+    @staticmethod
+    async def get_post_recipients(
+        db: AsyncSession, post_id: int
+    ) -> List[Tuple[int, bool]]:
+        """Получатели уведомления о посте: пары (user_id, is_liked)"""
+        recipients = await UserRepository.get_post_recipients(db, post_id)
+        logfire.info(f"Найдено {len(recipients)} пользователей для уведомления о посте {post_id}")
+        return recipients
+
+    @staticmethod
+    def iter_post_recipients(
+        db: AsyncSession, post_id: int, batch_size: int = 1000
+    ) -> AsyncIterator[Tuple[int, bool]]:
+        """Получатели уведомления о посте потоком, пачками из базы"""
+        return UserRepository.iter_post_recipients(db, post_id, batch_size)
+
     @staticmethod
     def format_post_notification(post: Post) -> str:
         """Форматировать уведомление о посте"""
@@ -61,60 +78,124 @@ class NotificationService:
         return "\n".join(lines)
 
     @staticmethod
-    async def send_post_notification(bot: Bot, post: Post, users: List[User], db: AsyncSession) -> None:
-        """Отправить уведомления о новом посте"""
-        logfire.info(f"Отправляем уведомления о посте {post.id} {len(users)} пользователям")
-        
-        await db.refresh(post, attribute_names=["author", "categories", "cities"])
-        
+    async def send_post_notification(
+        bot: Bot,
+        post: Post,
+        recipients: Union[Iterable[Tuple[int, bool]], AsyncIterable[Tuple[int, bool]]],
+        total: Optional[int] = None,
+        on_progress: Optional[ProgressFunc] = None,
+    ) -> FanoutStats:
+        """Отправить уведомления о новом посте через общий движок рассылки
+
+        recipients — пары (user_id, is_liked). Текст и фото готовятся заранее,
+        поэтому на каждого получателя приходится только один запрос к Telegram
+        и ни одного запроса к базе.
+        """
         notification_text = NotificationService.format_post_notification(post)
         post_url = getattr(post, "url", None)
 
-        success_count = 0
-        error_count = 0
-
-        for user in users:
-            try:
-                logfire.debug(f"Отправляем уведомление пользователю {user.id}")
-
-                is_liked = await db.scalar(
-                    select(Like.id).where(Like.user_id == user.id, Like.post_id == post.id)
-                ) is not None
-
-                keyboard = get_post_notification_keyboard(
-                    post_id=post.id,
-                    is_liked=is_liked,
-                    url=post_url,
+        # file_id Telegram, если фото уже отправлялось, иначе файл из хранилища
+        photo = await PostService.get_post_photo(post)
+
+        async def send(recipient: Tuple[int, bool]) -> None:
+            nonlocal photo
+            chat_id, is_liked = recipient
+            keyboard = get_post_notification_keyboard(
+                post_id=post.id,
+                is_liked=is_liked,
+                url=post_url,
+            )
+            if photo:
+                sent = await bot.send_photo(
+                    chat_id=chat_id,
+                    photo=photo,
+                    caption=notification_text,
+                    reply_markup=keyboard,
+                    parse_mode="HTML"
+                )
+                # После первой отправки остальным уходит уже file_id
+                if not post.tg_file_id:
+                    await PostService.remember_tg_file_id(post, sent)
+                    photo = post.tg_file_id or photo
+            else:
+                await bot.send_message(
+                    chat_id=chat_id,
+                    text=notification_text,
+                    reply_markup=keyboard,
+                    parse_mode="HTML"
                 )
 
-                if post.image_id:
-                    media_photo = await file_storage.get_media_photo(post.image_id)
-                    if media_photo:
-                        await bot.send_photo(
-                            chat_id=user.id,
-                            photo=media_photo.media,
-                            caption=notification_text,
-                            reply_markup=keyboard,
-                            parse_mode="HTML"
-                        )
-                    else:
-                        await bot.send_message(
-                            chat_id=user.id,
-                            text=notification_text,
-                            reply_markup=keyboard,
-                            parse_mode="HTML"
-                        )
-                else:
-                    await bot.send_message(
-                        chat_id=user.id,
-                        text=notification_text,
-                        reply_markup=keyboard,
-                        parse_mode="HTML"
-                    )
+        # Недоступные чаты (бот заблокирован, чат не найден) отключаются
+        # одним запросом после рассылки
+        unreachable: List[int] = []
+
+        def on_done(recipient: Tuple[int, bool], error: Optional[Exception]) -> None:
+            if error is not None and is_unreachable_chat(error):
+                unreachable.append(recipient[0])
+
+        stats = await get_fanout_engine().run(
+            recipients,
+            send,
+            total=total,
+            on_progress=on_progress,
+            chat_id_of=lambda recipient: recipient[0],
+            on_done=on_done,
+        )
+        logfire.info(
+            f"Уведомления о посте {post.id} отправлены: успех={stats.sent}, ошибок={stats.failed}"
+        )
+        if unreachable:
+            async with get_db_session() as db:
+                deactivated = await UserRepository.deactivate_users(db, unreachable)
+            logfire.info(f"Отключены недоступные пользователи: {deactivated}")
+        return stats
 
-                success_count += 1
-            except Exception as e:
-                logfire.warning(f"Ошибка отправки уведомления пользователю {user.id}: {e}")
-                error_count += 1
+    @staticmethod
+    async def notify_post_subscribers(
+        bot: Bot, post_id: int, report_chat_id: Optional[int] = None
+    ) -> Optional[FanoutStats]:
+        """Разослать уведомления об опубликованном посте (фоновая задача)
+
+        Работает со своей сессией; получатели читаются из базы пачками по
+        ходу рассылки, так что память не растет с размером аудитории.
+        Прогресс публикуется одним сообщением в report_chat_id.
+        """
+        async with get_db_session() as db:
+            post = await PostRepository.get_post_by_id(db, post_id)
+            if not post:
+                logfire.error(f"Пост {post_id} для рассылки уведомлений не найден")
+                return None
+            total = await UserRepository.count_post_recipients(db, post_id)
+            logfire.info(f"Найдено {total} пользователей для уведомления о посте {post_id}")
+            # Пост отсоединяем: чтение получателей пачками завершает транзакции
+            # сессии, и загруженные атрибуты не должны истекать
+            db.expunge_all()
+
+            progress_message = None
+            if report_chat_id:
+                try:
+                    progress_message = await bot.send_message(
+                        chat_id=report_chat_id,
+                        text=f"⏳ Рассылка уведомлений о посте «{post.title}»: 0/{total}",
+                    )
+                except Exception as e:
+                    logfire.warning(f"Не удалось отправить сообщение о рассылке: {e}")
+
+            async def report(stats: FanoutStats) -> None:
+                if not progress_message:
+                    return
+                done = stats.processed >= stats.total
+                status = "✅ Уведомления отправлены" if done else "⏳ Рассылка уведомлений"
+                await progress_message.edit_text(
+                    f"{status} о посте «{post.title}»: {stats.processed}/{stats.total}\n"
+                    f"Успешно: {stats.sent}\n"
+                    f"Ошибок: {stats.failed}"
+                )
 
-        logfire.info(f"Уведомления отправлены: успех={success_count}, ошибок={error_count}")
+            return await NotificationService.send_post_notification(
+                bot,
+                post,
+                NotificationService.iter_post_recipients(db, post_id),
+                total=total,
+                on_progress=report,
+            )
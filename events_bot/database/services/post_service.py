@@ -1,15 +1,23 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List, Optional
-from datetime import datetime, timezone
+from typing import List, Optional, Tuple, Union
+from datetime import datetime, timedelta, timezone
 from ..repositories import PostRepository
 from ..models import Post
 import os
 import logfire
 from events_bot.bot.keyboards.moderation_keyboard import get_moderation_keyboard
 from events_bot.storage import file_storage
-from aiogram.types import FSInputFile, InputMediaPhoto
+from aiogram.types import FSInputFile, InputMediaPhoto, InputFile, Message
+from sqlalchemy.orm.attributes import set_committed_value
+from events_bot.bot.utils import get_db_session
 from .moderation_service import ModerationService
 
+# Сколько просроченных постов удаляется одной транзакцией
+EXPIRED_CHUNK_SIZE = int(os.getenv("EXPIRED_CHUNK_SIZE", "500"))
+# Сколько секунд загруженная картинка защищена от очистки до создания поста
+# (по умолчанию как TTL черновика в FSM)
+PENDING_IMAGE_TTL = int(os.getenv("PENDING_IMAGE_TTL", str(60 * 60 * 24 * 3)))
+
 
 class PostService:
     """Асинхронный сервис для работы с постами"""
@@ -27,6 +35,7 @@ class PostService:
         url: str | None = None,
         address: str | None = None,
         bot=None,
+        tg_file_id: str | None = None,
     ) -> Post:
         parsed_event_at = None
         if event_at is not None:
@@ -38,7 +47,8 @@ class PostService:
             except Exception:
                 parsed_event_at = None
         post = await PostRepository.create_post(
-            db, title, content, author_id, category_ids, city_names, image_id, parsed_event_at, url, address
+            db, title, content, author_id, category_ids, city_names, image_id, parsed_event_at, url, address,
+            tg_file_id=tg_file_id,
         )
         if post and bot:
             await PostService.send_post_to_moderation(bot, post, db)
@@ -59,15 +69,16 @@ class PostService:
         logfire.debug(f"Текст модерации: {moderation_text[:100]}...")
         try:
             if post.image_id:
-                media_photo = await file_storage.get_media_photo(post.image_id)
-                if media_photo:
-                    await bot.send_photo(
+                photo = await PostService.get_post_photo(post)
+                if photo:
+                    sent = await bot.send_photo(
                         chat_id=moderation_group_id,
-                        photo=media_photo.media,
+                        photo=photo,
                         caption=moderation_text,
                         reply_markup=moderation_keyboard,
                         parse_mode="HTML",
                     )
+                    await PostService.remember_tg_file_id(post, sent, db)
                     return
                 else:
                     logfire.warning("Изображение не найдено")
@@ -82,6 +93,33 @@ class PostService:
             import traceback
             logfire.error(f"Стек ошибки: {traceback.format_exc()}")
 
+    @staticmethod
+    async def get_post_photo(post: Post) -> Optional[Union[str, InputFile]]:
+        """Фото поста для отправки: file_id Telegram, если он известен, иначе файл из хранилища"""
+        if post.tg_file_id:
+            return post.tg_file_id
+        if post.image_id:
+            media_photo = await file_storage.get_media_photo(post.image_id)
+            if media_photo:
+                return media_photo.media
+        return None
+
+    @staticmethod
+    async def remember_tg_file_id(post: Post, sent: Optional[Message], db: AsyncSession = None) -> None:
+        """Сохранить file_id из отправленного сообщения с фото поста"""
+        if post.tg_file_id or not sent or not sent.photo:
+            return
+        tg_file_id = sent.photo[-1].file_id
+        try:
+            if db is not None:
+                await PostRepository.set_tg_file_id(db, post.id, tg_file_id)
+            else:
+                async with get_db_session() as session:
+                    await PostRepository.set_tg_file_id(session, post.id, tg_file_id)
+            set_committed_value(post, "tg_file_id", tg_file_id)
+        except Exception as e:
+            logfire.warning(f"Не удалось сохранить file_id фото поста {post.id}: {e}")
+
     @staticmethod
     async def get_user_posts(db: AsyncSession, user_id: int) -> List[Post]:
         return await PostRepository.get_user_posts(db, user_id)
@@ -124,9 +162,23 @@ class PostService:
 
     @staticmethod
     async def get_feed_posts(
-        db: AsyncSession, user_id: int, limit: int = 10, offset: int = 0
+        db: AsyncSession,
+        user_id: int,
+        limit: int = 10,
+        cursor: str | None = None,
+        direction: str = "next",
     ) -> List[Post]:
-        return await PostRepository.get_feed_posts(db, user_id, limit, offset)
+        return await PostRepository.get_feed_posts(db, user_id, limit, cursor, direction)
+
+    @staticmethod
+    async def get_feed_page(
+        db: AsyncSession,
+        user_id: int,
+        limit: int = 10,
+        cursor: str | None = None,
+        direction: str = "next",
+    ) -> Tuple[List[Post], int]:
+        return await PostRepository.get_feed_page(db, user_id, limit, cursor, direction)
 
     @staticmethod
     async def get_feed_posts_count(db: AsyncSession, user_id: int) -> int:
@@ -134,21 +186,109 @@ class PostService:
 
     @staticmethod
     async def get_liked_posts(
-        db: AsyncSession, user_id: int, limit: int = 10, offset: int = 0
+        db: AsyncSession,
+        user_id: int,
+        limit: int = 10,
+        cursor: str | None = None,
+        direction: str = "next",
     ) -> List[Post]:
-        return await PostRepository.get_liked_posts(db, user_id, limit, offset)
+        return await PostRepository.get_liked_posts(db, user_id, limit, cursor, direction)
+
+    @staticmethod
+    async def get_liked_page(
+        db: AsyncSession,
+        user_id: int,
+        limit: int = 10,
+        cursor: str | None = None,
+        direction: str = "next",
+    ) -> Tuple[List[Post], int]:
+        return await PostRepository.get_liked_page(db, user_id, limit, cursor, direction)
 
     @staticmethod
     async def get_liked_posts_count(db: AsyncSession, user_id: int) -> int:
         return await PostRepository.get_liked_posts_count(db, user_id)
 
     @staticmethod
-    async def delete_expired_posts(db: AsyncSession) -> int:
-        return await PostRepository.delete_expired_posts(db)
+    async def delete_expired_posts(
+        db: AsyncSession, chunk_size: int = EXPIRED_CHUNK_SIZE
+    ) -> int:
+        """Удалить прошедшие мероприятия и их картинки
+
+        Посты удаляются пачками по chunk_size, каждая пачка — отдельная
+        транзакция под advisory-блокировкой, поэтому очистку выполняет
+        только один процесс. Возвращает количество удаленных постов.
+        """
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        total = 0
+        while True:
+            if not await PostRepository.try_lock_expired_cleanup(db):
+                await db.rollback()
+                logfire.info("Очистку просроченных постов выполняет другой процесс")
+                return total
+            deleted = await PostRepository.delete_expired_posts(db, now, chunk_size)
+            await db.commit()
+            total += len(deleted)
+            await PostService._delete_unused_images(
+                db, {image_id for _, image_id in deleted if image_id}
+            )
+            if len(deleted) < chunk_size:
+                return total
+
+    @staticmethod
+    async def hold_pending_image(db: AsyncSession, image_id: str) -> None:
+        """Защитить загруженную картинку от очистки, пока создается пост
+
+        Вызывается до проверки, есть ли файл в хранилище: если очистка
+        удалит файл раньше, загрузка его не найдет и сохранит заново.
+        """
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        await PostRepository.hold_pending_image(db, image_id, now)
+        await db.commit()
+
+    @staticmethod
+    async def purge_pending_images(
+        db: AsyncSession, chunk_size: int = EXPIRED_CHUNK_SIZE
+    ) -> int:
+        """Удалить записи брошенных загрузок и их файлы, если те не используются
+
+        Возвращает количество удаленных записей.
+        """
+        before = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(
+            seconds=PENDING_IMAGE_TTL
+        )
+        total = 0
+        while True:
+            image_ids = await PostRepository.delete_expired_pending_images(
+                db, before, chunk_size
+            )
+            await db.commit()
+            total += len(image_ids)
+            await PostService._delete_unused_images(db, set(image_ids))
+            if len(image_ids) < chunk_size:
+                return total
+
+    @staticmethod
+    async def _delete_unused_images(db: AsyncSession, image_ids: set) -> None:
+        """Удалить файлы, которые не нужны ни постам, ни незавершенным загрузкам
+
+        Новые загрузки ждут конца транзакции: загрузка, начатая после
+        проверки, уже не найдет удаленный файл и сохранит его заново.
+        """
+        if not image_ids:
+            return
+        try:
+            await PostRepository.lock_pending_images(db)
+            image_ids -= await PostRepository.get_used_image_ids(db, list(image_ids))
+            if image_ids:
+                await file_storage.delete_files(list(image_ids))
+        finally:
+            # Транзакция ничего не меняла, она только держала блокировку
+            await db.rollback()
 
     @staticmethod
-    async def get_expired_posts_info(db: AsyncSession) -> list[dict]:
-        return await PostRepository.get_expired_posts_info(db)
+    async def get_next_event_at(db: AsyncSession) -> Optional[datetime]:
+        """Когда истечет ближайший пост"""
+        return await PostRepository.get_next_event_at(db)
 
     @staticmethod
     async def delete_post(db: AsyncSession, post_id: int) -> bool:
@@ -1,7 +1,7 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from sqlalchemy.orm import selectinload
-from typing import List
+from typing import AsyncIterator, List
 from ..repositories import UserRepository
 from ..models import User, Category, City
 
@@ -63,3 +63,18 @@ class UserService:
     async def get_all_users(db: AsyncSession) -> List[User]:
         """Получить всех пользователей"""
         return await UserRepository.get_all_users(db)
+
+    @staticmethod
+    def iter_user_ids(db: AsyncSession, batch_size: int = 1000) -> AsyncIterator[int]:
+        """id всех пользователей потоком, без загрузки ORM-объектов"""
+        return UserRepository.iter_user_ids(db, batch_size)
+
+    @staticmethod
+    async def count_users(db: AsyncSession) -> int:
+        """Количество пользователей"""
+        return await UserRepository.count_users(db)
+
+    @staticmethod
+    async def deactivate_users(db: AsyncSession, user_ids: List[int]) -> int:
+        """Отключить пользователей, до которых не доходят сообщения"""
+        return await UserRepository.deactivate_users(db, user_ids)
@@ -3,6 +3,8 @@ import logfire
 from .interfaces import FileStorageInterface
 from .file_storage import LocalFileStorage
 from .s3_storage import S3FileStorage
+from .url_cache import PresignedUrlCache
+from .cached_storage import CachedFileStorage
 
 def has_s3_credentials() -> bool:
     """Проверить наличие данных для авторизации в S3"""
@@ -14,6 +16,17 @@ def has_s3_credentials() -> bool:
     
     return all(os.getenv(var) for var in required_vars)
 
+def with_image_cache(storage: FileStorageInterface) -> FileStorageInterface:
+    """Добавить дисковый кэш картинок, если задан IMAGE_CACHE_DIR"""
+    cache_dir = os.getenv("IMAGE_CACHE_DIR")
+    if not cache_dir:
+        return storage
+    max_bytes = int(os.getenv("IMAGE_CACHE_MAX_MB", "512")) * 1024 * 1024
+    # Воркеры BOT_WORKERS делят одну папку, каждый считает только свои файлы
+    max_bytes //= max(1, int(os.getenv("BOT_WORKERS", "1")))
+    logfire.info(f"Image cache enabled: {cache_dir}, max {max_bytes} bytes")
+    return CachedFileStorage(storage, cache_dir, max_bytes)
+
 # Инициализируем файловое хранилище в зависимости от доступности S3
 def get_file_storage() -> FileStorageInterface:
     """Получить подходящее файловое хранилище"""
@@ -21,7 +34,7 @@ def get_file_storage() -> FileStorageInterface:
     if has_s3_credentials():
         try:
             logfire.info("Initializing S3 storage with provided credentials")
-            return S3FileStorage()
+            return with_image_cache(S3FileStorage())
         except ValueError as e:
             logfire.warning(f"Failed to initialize S3 storage: {e}, falling back to local storage")
             return LocalFileStorage()
@@ -32,4 +45,4 @@ def get_file_storage() -> FileStorageInterface:
 # Инициализируем файловое хранилище для использования во всем приложении
 file_storage = get_file_storage()
 
-__all__ = ["FileStorageInterface", "LocalFileStorage", "S3FileStorage", "file_storage", "get_file_storage"] 
+__all__ = ["FileStorageInterface", "LocalFileStorage", "S3FileStorage", "CachedFileStorage", "PresignedUrlCache", "file_storage", "get_file_storage"] 
@@ -0,0 +1,72 @@
+"""Перевод image_id постов на полные ключи файлов
+
+Запуск: python -m events_bot.storage.backfill_keys
+
+У постов, созданных до перехода на ключи "<uuid>.<расширение>", в image_id
+хранится только uuid, и хранилище перебирает расширения при каждом
+обращении к картинке. Скрипт находит настоящий ключ каждого такого файла
+и записывает его в image_id. Повторный запуск безопасен: обрабатываются
+только id старого формата.
+"""
+import asyncio
+import sys
+
+from sqlalchemy import select, update
+
+from ..database.connection import init_engine, dispose_engine, get_session_maker
+from ..database.models import Post
+from . import file_storage
+
+BATCH_SIZE = 100
+
+
+async def backfill_keys() -> tuple[int, int]:
+    """Вернуть (обновлено постов, файлов не найдено)"""
+    updated = missing = 0
+    last_id = 0
+    async with get_session_maker()() as db:
+        while True:
+            result = await db.execute(
+                select(Post.id, Post.image_id)
+                .where(
+                    Post.id > last_id,
+                    Post.image_id.is_not(None),
+                    Post.image_id.not_like("%.%"),
+                )
+                .order_by(Post.id)
+                .limit(BATCH_SIZE)
+            )
+            rows = result.all()
+            if not rows:
+                break
+            for post_id, image_id in rows:
+                key = await file_storage.find_key(image_id)
+                if not key:
+                    print(f"Пост {post_id}: файл {image_id} не найден")
+                    missing += 1
+                    continue
+                await db.execute(
+                    update(Post)
+                    .where(Post.id == post_id, Post.image_id == image_id)
+                    .values(image_id=key)
+                )
+                updated += 1
+            await db.commit()
+            last_id = rows[-1].id
+    return updated, missing
+
+
+async def main() -> int:
+    init_engine()
+    await file_storage.start()
+    try:
+        updated, missing = await backfill_keys()
+    finally:
+        await file_storage.close()
+        await dispose_engine()
+    print(f"Обновлено постов: {updated}, файлов не найдено: {missing}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,260 @@
+import asyncio
+import os
+import re
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional
+
+import aiofiles
+import logfire
+from aiogram.types import BufferedInputFile, InputMediaPhoto
+
+from .interfaces import FileData, FileStorageInterface, iter_chunks
+
+# Имена, которые можно использовать как имя файла в кэше
+_SAFE_KEY = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*$")
+
+
+def _scan(cache_path: Path) -> Dict[str, int]:
+    """Файлы кэша от давно измененных к недавним (блокирующая функция)
+
+    Недописанные временные файлы прошлых запусков удаляются.
+    """
+    cache_path.mkdir(parents=True, exist_ok=True)
+    files = []
+    for path in cache_path.iterdir():
+        if not path.is_file():
+            continue
+        if path.name.endswith(".tmp"):
+            path.unlink(missing_ok=True)
+            continue
+        stat = path.stat()
+        files.append((stat.st_mtime, path.name, stat.st_size))
+    return {name: size for _, name, size in sorted(files)}
+
+
+def _unlink_all(paths: List[Path]) -> None:
+    for path in paths:
+        path.unlink(missing_ok=True)
+
+
+class CachedFileStorage(FileStorageInterface):
+    """Дисковый LRU-кэш картинок перед другим хранилищем (обычно S3)
+
+    Объект под ключом хранилища никогда не меняется, поэтому копия на диске
+    не устаревает. Картинки отправляются в Telegram из кэша без временных
+    ссылок. Суммарный размер кэша ограничен max_bytes, при переполнении
+    удаляются давно не запрашиваемые файлы.
+
+    Папку могут делить несколько процессов бота: каждый считает только
+    свои байты (поэтому max_bytes — доля процесса, см. with_image_cache),
+    а файл, удаленный другим процессом, считается промахом. Работа с
+    диском идет в потоках.
+    """
+
+    def __init__(self, backend: FileStorageInterface, cache_path: str, max_bytes: int):
+        """
+        Args:
+            backend: Хранилище, в котором лежат оригиналы
+            cache_path: Папка кэша
+            max_bytes: Максимальный суммарный размер файлов в кэше
+        """
+        self.backend = backend
+        self.cache_path = Path(cache_path)
+        self.max_bytes = max_bytes
+        # Ключ -> размер файла, от давно запрошенных к недавним
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+
+    async def _load(self) -> None:
+        """Подхватить файлы, оставшиеся в кэше с прошлого запуска"""
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if self._loaded:
+                return
+            files = await asyncio.to_thread(_scan, self.cache_path)
+            for file_id, size in files.items():
+                self._entries[file_id] = size
+                self._total_bytes += size
+            self._loaded = True
+            await self._evict()
+            logfire.info(
+                f"Image cache: {len(self._entries)} files, {self._total_bytes} bytes"
+            )
+
+    def _forget(self, file_id: str) -> None:
+        size = self._entries.pop(file_id, None)
+        if size is not None:
+            self._total_bytes -= size
+
+    async def _evict(self) -> None:
+        paths = []
+        while self._total_bytes > self.max_bytes and self._entries:
+            file_id, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            paths.append(self.cache_path / file_id)
+        if paths:
+            await asyncio.to_thread(_unlink_all, paths)
+
+    async def _read_cached(self, file_id: str) -> Optional[bytes]:
+        """Содержимое файла из кэша или None при промахе"""
+        await self._load()
+        if file_id not in self._entries:
+            return None
+        self._entries.move_to_end(file_id)
+        try:
+            async with aiofiles.open(self.cache_path / file_id, 'rb') as f:
+                return await f.read()
+        except FileNotFoundError:
+            # Файл вытеснил другой процесс, который делит ту же папку
+            self._forget(file_id)
+            return None
+
+    def _tmp_path(self, file_id: str) -> Path:
+        # Пишем во временный файл, чтобы не отдать недописанную картинку
+        return self.cache_path / f"{file_id}.{uuid.uuid4().hex}.tmp"
+
+    async def _commit(self, tmp_path: Path, file_id: str, size: int) -> None:
+        """Переименовать дописанный временный файл в файл кэша"""
+        if not _SAFE_KEY.match(file_id) or size > self.max_bytes:
+            await asyncio.to_thread(tmp_path.unlink, missing_ok=True)
+            return
+        try:
+            await asyncio.to_thread(os.replace, tmp_path, self.cache_path / file_id)
+        except OSError as e:
+            logfire.warning(f"Не удалось сохранить {file_id} в кэш картинок: {e}")
+            await asyncio.to_thread(tmp_path.unlink, missing_ok=True)
+            return
+        self._forget(file_id)
+        self._entries[file_id] = size
+        self._total_bytes += size
+        await self._evict()
+
+    async def _store(self, file_id: str, file_data: bytes) -> None:
+        """Положить копию файла в кэш"""
+        await self._load()
+        if not _SAFE_KEY.match(file_id) or len(file_data) > self.max_bytes:
+            return
+        tmp_path = self._tmp_path(file_id)
+        try:
+            async with aiofiles.open(tmp_path, 'wb') as f:
+                await f.write(file_data)
+        except OSError as e:
+            logfire.warning(f"Не удалось сохранить {file_id} в кэш картинок: {e}")
+            await asyncio.to_thread(tmp_path.unlink, missing_ok=True)
+            return
+        await self._commit(tmp_path, file_id, len(file_data))
+
+    async def _tee(
+        self, file_data: FileData, tmp_path: Path, written: List[int]
+    ) -> AsyncIterator[bytes]:
+        """Отдать куски потока хранилищу, по пути записывая их в кэш
+
+        Ошибка записи в кэш не прерывает загрузку: копия просто не сохраняется.
+        """
+        cache_file = None
+        try:
+            try:
+                cache_file = await aiofiles.open(tmp_path, 'wb')
+            except OSError as e:
+                logfire.warning(f"Не удалось открыть файл кэша картинок: {e}")
+            async for chunk in iter_chunks(file_data):
+                if cache_file is not None:
+                    try:
+                        await cache_file.write(chunk)
+                        written[0] += len(chunk)
+                    except OSError as e:
+                        logfire.warning(f"Не удалось записать кэш картинок: {e}")
+                        await cache_file.close()
+                        cache_file = None
+                        written[0] = -1
+                yield chunk
+        finally:
+            if cache_file is not None:
+                await cache_file.close()
+
+    async def start(self) -> None:
+        await self._load()
+        await self.backend.start()
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+    async def save_file(
+        self, file_data: FileData, file_extension: str, file_id: Optional[str] = None
+    ) -> str:
+        """Сохранить файл в хранилище и сразу в кэш (его скоро отправят модераторам)"""
+        if isinstance(file_data, (bytes, bytearray, memoryview)):
+            file_id = await self.backend.save_file(file_data, file_extension, file_id)
+            await self._store(file_id, bytes(file_data))
+            return file_id
+
+        # Поток читается один раз: копия в кэш пишется по ходу загрузки
+        await self._load()
+        tmp_path = self._tmp_path(uuid.uuid4().hex)
+        written = [0]
+        try:
+            file_id = await self.backend.save_file(
+                self._tee(file_data, tmp_path, written), file_extension, file_id
+            )
+        except BaseException:
+            await asyncio.to_thread(tmp_path.unlink, missing_ok=True)
+            raise
+        if written[0] < 0:
+            await asyncio.to_thread(tmp_path.unlink, missing_ok=True)
+        else:
+            await self._commit(tmp_path, file_id, written[0])
+        return file_id
+
+    async def find_key(self, file_id: str) -> Optional[str]:
+        return await self.backend.find_key(file_id)
+
+    async def read_file(self, file_id: str) -> Optional[bytes]:
+        file_data = await self._read_cached(file_id)
+        if file_data is not None:
+            return file_data
+        file_data = await self.backend.read_file(file_id)
+        if file_data is not None:
+            await self._store(file_id, file_data)
+        return file_data
+
+    async def get_media_photo(self, file_id: str) -> Optional[InputMediaPhoto]:
+        """Отдать картинку из кэша, при промахе скачать ее в кэш
+
+        Картинка передается байтами, а не путем: файл может быть вытеснен
+        раньше, чем Telegram его прочитает.
+        """
+        file_data = await self._read_cached(file_id)
+        if file_data is None:
+            try:
+                file_data = await self.backend.read_file(file_id)
+            except Exception as e:
+                logfire.warning(f"Не удалось скачать {file_id} в кэш картинок: {e}")
+                file_data = None
+            if file_data is None:
+                return await self.backend.get_media_photo(file_id)
+            await self._store(file_id, file_data)
+        return InputMediaPhoto(media=BufferedInputFile(file_data, filename=file_id))
+
+    async def get_file_url(self, file_id: str, expires_in: int = 3600) -> Optional[str]:
+        return await self.backend.get_file_url(file_id, expires_in)
+
+    async def delete_file(self, file_id: str) -> bool:
+        await self._drop([file_id])
+        return await self.backend.delete_file(file_id)
+
+    async def delete_files(self, file_ids: List[str], concurrency: int = 10) -> int:
+        await self._drop(file_ids)
+        return await self.backend.delete_files(file_ids, concurrency)
+
+    async def _drop(self, file_ids: List[str]) -> None:
+        await self._load()
+        for file_id in file_ids:
+            self._forget(file_id)
+        # Файл мог положить в кэш и другой процесс
+        paths = [self.cache_path / file_id for file_id in file_ids if _SAFE_KEY.match(file_id)]
+        await asyncio.to_thread(_unlink_all, paths)
@@ -1,57 +1,113 @@
 from typing import Optional
+import asyncio
 import aiofiles
 import os
+import re
 import uuid
 from pathlib import Path
 from aiogram.types import InputMediaPhoto, FSInputFile
-from .interfaces import FileStorageInterface
+from .interfaces import FileData, FileStorageInterface, iter_chunks, storage_keys
+
+# Ключи, которые раскладываются по подпапкам: uuid и хэши начинаются с hex
+_SHARDED_KEY = re.compile(r"^[0-9a-f]{2}[0-9a-f-]*\.\w+$")
 
 
 class LocalFileStorage(FileStorageInterface):
-    """Локальное файловое хранилище через aiofiles"""
+    """Локальное файловое хранилище через aiofiles
+    
+    Файлы раскладываются по подпапкам по первым двум символам ключа
+    ("ab/abcdef....jpg"), чтобы в одной папке не копились тысячи файлов.
+    Файлы, сохраненные раньше в корень папки, по-прежнему находятся.
+    Вся работа с диском идет в потоках и не блокирует цикл событий.
+    """
     
     def __init__(self, storage_path: str = "uploads"):
         """
         Args:
-            storage_path: Путь к папке для хранения файлов
+            storage_path: Путь к папке для хранения файлов (создается
+                при первом сохранении файла)
         """
         self.storage_path = Path(os.getcwd()) / Path(storage_path)
-        self.storage_path.mkdir(parents=True, exist_ok=True)
     
-    async def save_file(self, file_data: bytes, file_extension: str) -> str:
-        """Сохранить файл локально"""
-        # Генерируем уникальный id
-        file_id = str(uuid.uuid4())
-        file_path = self.storage_path / f"{file_id}.{file_extension}"
+    def _key_path(self, key: str) -> Path:
+        """Путь, по которому сохраняется файл с этим ключом"""
+        if _SHARDED_KEY.match(key):
+            return self.storage_path / key[:2] / key
+        return self.storage_path / key
+    
+    async def save_file(
+        self, file_data: FileData, file_extension: str, file_id: Optional[str] = None
+    ) -> str:
+        """Сохранить файл локально, записывая его по кускам"""
+        # Id файла — его имя в папке хранилища
+        file_id = file_id or f"{uuid.uuid4()}.{file_extension}"
+        file_path = self._key_path(file_id)
+        await asyncio.to_thread(file_path.parent.mkdir, parents=True, exist_ok=True)
         
-        # Сохраняем файл асинхронно
-        async with aiofiles.open(file_path, 'wb') as f:
-            await f.write(file_data)
+        # Пишем во временный файл, чтобы оборванная загрузка не оставила
+        # недописанную картинку под настоящим именем
+        tmp_path = file_path.parent / f"{file_id}.{uuid.uuid4().hex}.tmp"
+        try:
+            async with aiofiles.open(tmp_path, 'wb') as f:
+                async for chunk in iter_chunks(file_data):
+                    await f.write(chunk)
+            await asyncio.to_thread(os.replace, tmp_path, file_path)
+        except BaseException:
+            await asyncio.to_thread(tmp_path.unlink, missing_ok=True)
+            raise
         
         return file_id
     
+    def _find_path(self, file_id: str) -> Optional[Path]:
+        """Путь к файлу: подпапка по ключу, затем корень (файлы до разбиения)
+        
+        Блокирующая функция, вызывается через _locate.
+        """
+        for key in storage_keys(file_id):
+            for file_path in (self._key_path(key), self.storage_path / key):
+                if file_path.is_file():
+                    return file_path
+        return None
+    
+    async def _locate(self, file_id: str) -> Optional[Path]:
+        """Найти файл, не блокируя цикл событий"""
+        return await asyncio.to_thread(self._find_path, file_id)
+    
+    async def find_key(self, file_id: str) -> Optional[str]:
+        """Найти имя файла в папке хранилища"""
+        file_path = await self._locate(file_id)
+        return file_path.name if file_path else None
+    
+    async def read_file(self, file_id: str) -> Optional[bytes]:
+        """Прочитать файл по id"""
+        file_path = await self._locate(file_id)
+        if not file_path:
+            return None
+        async with aiofiles.open(file_path, 'rb') as f:
+            return await f.read()
+    
     async def get_media_photo(self, file_id: str) -> Optional[InputMediaPhoto]:
         """Получить файл как InputMediaPhoto для отправки в Telegram"""
-        # Ищем файл по id (проверяем все возможные расширения)
-        for file_path in self.storage_path.glob(f"{file_id}.*"):
-            if file_path.exists():
-                return InputMediaPhoto(media=FSInputFile(str(file_path)))
+        file_path = await self._locate(file_id)
+        if file_path:
+            return InputMediaPhoto(media=FSInputFile(str(file_path)))
         return None
     
     async def get_file_url(self, file_id: str, expires_in: int = 3600) -> Optional[str]:
         """Получить URL файла для прямого доступа (локальный путь)"""
-        # Ищем файл по id (проверяем все возможные расширения)
-        for file_path in self.storage_path.glob(f"{file_id}.*"):
-            if file_path.exists():
-                # Возвращаем абсолютный путь к файлу
-                return str(file_path.absolute())
+        file_path = await self._locate(file_id)
+        if file_path:
+            # Возвращаем абсолютный путь к файлу
+            return str(file_path.absolute())
         return None
     
+    def _delete(self, file_id: str) -> bool:
+        file_path = self._find_path(file_id)
+        if file_path:
+            file_path.unlink(missing_ok=True)
+            return True
+        return False
+    
     async def delete_file(self, file_id: str) -> bool:
         """Удалить файл по id"""
-        # Ищем файл по id
-        for file_path in self.storage_path.glob(f"{file_id}.*"):
-            if file_path.exists():
-                file_path.unlink()
-                return True
-        return False
+        return await asyncio.to_thread(self._delete, file_id)
@@ -0,0 +1,116 @@
+"""
+Подготовка картинок постов перед сохранением
+
+Картинка уменьшается до размера, который Telegram все равно показывает,
+пережимается в JPEG и сохраняется под ключом из хэша содержимого:
+одинаковые загрузки занимают в хранилище один файл.
+"""
+
+import asyncio
+import hashlib
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import BinaryIO, Optional
+
+import logfire
+from PIL import Image, ImageOps
+
+from . import file_storage
+from ..bot.utils import get_db_session
+from ..database.services.post_service import PostService
+
+# Telegram показывает фото не больше 1280 пикселей по длинной стороне
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1280"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+# Сколько байт загружаемой картинки держать в памяти, остальное — на диске
+IMAGE_SPOOL_SIZE = 1024 * 1024
+# Декодирование и сжатие идут в потоках, не блокируя цикл событий
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=IMAGE_WORKERS, thread_name_prefix="image"
+        )
+    return _executor
+
+
+@dataclass
+class ProcessedImage:
+    """Готовая к сохранению картинка"""
+
+    data: bytes
+    extension: str
+    content_hash: str
+
+    @property
+    def file_id(self) -> str:
+        return f"{self.content_hash}.{self.extension}"
+
+
+def normalize_image(
+    source: BinaryIO,
+    max_side: int = IMAGE_MAX_SIDE,
+    quality: int = IMAGE_JPEG_QUALITY,
+) -> ProcessedImage:
+    """Уменьшить и пережать картинку в JPEG (блокирующая функция)"""
+    with Image.open(source) as image:
+        is_jpeg = image.format == "JPEG"
+        fits = max(image.size) <= max_side
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "L"):
+            # У JPEG нет прозрачности: кладем картинку на белый фон
+            rgba = image.convert("RGBA")
+            image = Image.new("RGB", rgba.size, (255, 255, 255))
+            image.paste(rgba, mask=rgba.getchannel("A"))
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        output = io.BytesIO()
+        image.save(output, "JPEG", quality=quality, optimize=True, progressive=True)
+    data = output.getvalue()
+
+    # Небольшой исходный JPEG пережатие может только увеличить
+    if is_jpeg and fits:
+        source.seek(0)
+        original = source.read()
+        if len(original) <= len(data):
+            data = original
+
+    return ProcessedImage(
+        data=data, extension="jpg", content_hash=hashlib.sha256(data).hexdigest()
+    )
+
+
+async def process_image(source: BinaryIO) -> ProcessedImage:
+    """Подготовить картинку в пуле потоков"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), normalize_image, source)
+
+
+async def save_image(source: BinaryIO) -> str:
+    """Подготовить и сохранить картинку, вернуть ее id в хранилище
+
+    Если такая картинка уже есть, повторно она не загружается. Ключ
+    записывается как незавершенная загрузка до поиска файла: пока пост
+    не создан, очистка не удалит файл, даже если другой пост с той же
+    картинкой истечет.
+    """
+    try:
+        image = await process_image(source)
+    except Exception as e:
+        # Не картинка или неизвестный формат: сохраняем как есть
+        logfire.warning(f"Не удалось обработать картинку, сохраняем оригинал: {e}")
+        source.seek(0)
+        return await file_storage.save_file(source, "jpg")
+
+    async with get_db_session() as db:
+        await PostService.hold_pending_image(db, image.file_id)
+    if await file_storage.find_key(image.file_id):
+        logfire.info(f"Картинка {image.file_id} уже есть в хранилище")
+        return image.file_id
+    return await file_storage.save_file(image.data, image.extension, image.file_id)
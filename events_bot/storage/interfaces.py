@@ -1,22 +1,113 @@
+import asyncio
+import io
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import AsyncIterable, AsyncIterator, BinaryIO, List, Optional, Union
 from aiogram.types import InputMediaPhoto
 
+# Данные файла: bytes, файловый объект или асинхронный поток кусков
+FileData = Union[bytes, BinaryIO, AsyncIterable[bytes]]
+
+# Размер куска при потоковой записи файла
+CHUNK_SIZE = 256 * 1024
+
+# Расширения, которые перебираются для id старого формата
+LEGACY_EXTENSIONS = ['jpg', 'jpeg', 'png', 'gif', 'webp']
+
+
+def storage_keys(file_id: str) -> List[str]:
+    """
+    Возможные ключи файла в хранилище
+
+    Id файла — это его полный ключ "<uuid>.<расширение>". У id старого
+    формата (только uuid) расширение неизвестно, и возвращаются все
+    возможные ключи.
+    """
+    if "." in file_id:
+        return [file_id]
+    return [f"{file_id}.{extension}" for extension in LEGACY_EXTENSIONS]
+
+
+async def iter_chunks(
+    file_data: FileData, chunk_size: int = CHUNK_SIZE
+) -> AsyncIterator[bytes]:
+    """
+    Прочитать данные файла по кускам, не собирая их целиком в памяти
+
+    bytes отдаются одним куском без копирования. Файл на диске читается
+    в потоке, чтобы не блокировать цикл событий.
+    """
+    if isinstance(file_data, (bytes, bytearray, memoryview)):
+        if file_data:
+            yield file_data
+        return
+    if hasattr(file_data, "__aiter__"):
+        async for chunk in file_data:
+            if chunk:
+                yield chunk
+        return
+    while True:
+        if isinstance(file_data, io.BytesIO):
+            chunk = file_data.read(chunk_size)
+        else:
+            chunk = await asyncio.to_thread(file_data.read, chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
 
 class FileStorageInterface(ABC):
     """Абстрактный интерфейс для файлового хранилища"""
     
+    async def start(self) -> None:
+        """Открыть соединения хранилища (при запуске бота)"""
+        pass
+    
+    async def close(self) -> None:
+        """Закрыть соединения хранилища (при остановке бота)"""
+        pass
+    
     @abstractmethod
-    async def save_file(self, file_data: bytes, file_extension: str) -> str:
+    async def save_file(
+        self, file_data: FileData, file_extension: str, file_id: Optional[str] = None
+    ) -> str:
         """
         Сохранить файл и вернуть его id
         
         Args:
-            file_data: Данные файла в bytes
+            file_data: Данные файла: bytes, файловый объект (читается с текущей
+                позиции) или асинхронный поток кусков bytes
             file_extension: Расширение файла (например, 'jpg')
+            file_id: Готовый ключ "<имя>.<расширение>" (например, по хэшу
+                содержимого); по умолчанию создается новый
+            
+        Returns:
+            str: Уникальный id файла, он же ключ "<uuid>.<расширение>"
+        """
+        pass
+    
+    @abstractmethod
+    async def find_key(self, file_id: str) -> Optional[str]:
+        """
+        Найти полный ключ существующего файла
+        
+        Args:
+            file_id: Id файла (в том числе старого формата без расширения)
+            
+        Returns:
+            Optional[str]: Ключ файла или None если файл не найден
+        """
+        pass
+    
+    @abstractmethod
+    async def read_file(self, file_id: str) -> Optional[bytes]:
+        """
+        Прочитать содержимое файла
+        
+        Args:
+            file_id: Id файла
             
         Returns:
-            str: Уникальный id файла
+            Optional[bytes]: Данные файла или None если файл не найден
         """
         pass
     
@@ -58,4 +149,24 @@ class FileStorageInterface(ABC):
         Returns:
             bool: True если файл удален, False если файл не найден
         """
-        pass 
+        pass
+
+    async def delete_files(self, file_ids: List[str], concurrency: int = 10) -> int:
+        """
+        Удалить несколько файлов параллельно
+
+        Args:
+            file_ids: Id файлов
+            concurrency: Сколько файлов удаляется одновременно
+
+        Returns:
+            int: Количество удаленных файлов
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def delete(file_id: str) -> bool:
+            async with semaphore:
+                return await self.delete_file(file_id)
+
+        results = await asyncio.gather(*(delete(file_id) for file_id in file_ids))
+        return sum(results)
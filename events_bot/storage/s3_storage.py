@@ -1,15 +1,22 @@
+import asyncio
 import os
 import uuid
-from typing import Optional
+from typing import List, Optional
 from pathlib import Path
 from aioboto3 import Session
+from aiobotocore.config import AioConfig
 from aiogram.types import InputMediaPhoto, URLInputFile
 from botocore.exceptions import ClientError, NoCredentialsError
-from .interfaces import FileStorageInterface
+from .interfaces import FileData, FileStorageInterface, iter_chunks, storage_keys
+from .url_cache import PresignedUrlCache
 import logfire
 from types_aiobotocore_s3 import Client
 
 
+# Минимальный размер части multipart-загрузки в S3 — 5 МБ
+S3_PART_SIZE = max(int(os.getenv("S3_PART_SIZE_MB", "8")), 5) * 1024 * 1024
+
+
 class S3FileStorage(FileStorageInterface):
     """S3 файловое хранилище для продакшена"""
     
@@ -46,116 +53,245 @@ class S3FileStorage(FileStorageInterface):
             aws_secret_access_key=self.aws_secret_access_key,
             region_name=self.region_name
         )
+        # Один клиент с пулом соединений на процесс, см. start()/close()
+        self._client: Optional[Client] = None
+        self._client_context = None
+        self._client_lock = asyncio.Lock()
+        # Выданные временные ссылки: повторный показ поста не обращается к S3
+        self.url_cache = PresignedUrlCache(
+            max_size=int(os.getenv("S3_URL_CACHE_SIZE", "1024")),
+            margin=float(os.getenv("S3_URL_CACHE_MARGIN", "300")),
+        )
+    
+    def _client_config(self) -> AioConfig:
+        """Пул соединений и таймауты клиента из переменных окружения"""
+        options = {}
+        # path нужен MinIO и moto server без поддоменов для bucket
+        addressing_style = os.getenv("S3_ADDRESSING_STYLE")
+        if addressing_style:
+            options["s3"] = {"addressing_style": addressing_style}
+        return AioConfig(
+            max_pool_connections=int(os.getenv("S3_MAX_CONNECTIONS", "20")),
+            connect_timeout=float(os.getenv("S3_CONNECT_TIMEOUT", "5")),
+            read_timeout=float(os.getenv("S3_READ_TIMEOUT", "30")),
+            retries={"max_attempts": 3, "mode": "standard"},
+            tcp_keepalive=True,
+            connector_args={
+                "keepalive_timeout": float(os.getenv("S3_KEEPALIVE_TIMEOUT", "60"))
+            },
+            **options,
+        )
+    
+    async def start(self) -> None:
+        """Открыть клиент S3; повторный вызов ничего не делает"""
+        async with self._client_lock:
+            if self._client is not None:
+                return
+            self._client_context = self.session.client(
+                's3',
+                endpoint_url=self.endpoint_url,
+                use_ssl=False,
+                config=self._client_config()
+            )
+            self._client = await self._client_context.__aenter__()
+            logfire.info("S3 client opened")
+    
+    async def close(self) -> None:
+        """Закрыть клиент S3 и его соединения"""
+        async with self._client_lock:
+            if self._client is None:
+                return
+            context, self._client, self._client_context = self._client_context, None, None
+            await context.__aexit__(None, None, None)
+            logfire.info("S3 client closed")
     
-    async def save_file(self, file_data: bytes, file_extension: str) -> str:
+    async def _get_client(self) -> Client:
+        """Общий клиент S3 (открывается при первом обращении, если не открыт)"""
+        if self._client is None:
+            await self.start()
+        return self._client
+    
+    async def save_file(
+        self, file_data: FileData, file_extension: str, file_id: Optional[str] = None
+    ) -> str:
         """Сохранить файл в S3"""
-        # Генерируем уникальный id
-        file_id = str(uuid.uuid4())
-        key = f"{file_id}.{file_extension}"
+        # Id файла — его полный ключ в bucket
+        key = file_id or f"{uuid.uuid4()}.{file_extension}"
+        content_type = self._get_content_type(file_extension)
         
         try:
-            async with self.session.client(
-                's3',
-                endpoint_url=self.endpoint_url,
-                use_ssl=False
-            ) as s3_client:
+            s3_client = await self._get_client()
+            if isinstance(file_data, (bytes, bytearray, memoryview)):
                 await s3_client.put_object(
                     Bucket=self.bucket_name,
                     Key=key,
                     Body=file_data,
-                    ContentType=self._get_content_type(file_extension)
+                    ContentType=content_type
                 )
+            else:
+                await self._upload_stream(s3_client, key, file_data, content_type)
                 
             logfire.info(f"File saved to S3: {key}")
-            return file_id
+            return key
             
         except Exception as e:
             logfire.error(f"Error saving file to S3: {e}")
             raise
     
-    async def get_media_photo(self, file_id: str) -> Optional[InputMediaPhoto]:
-        """Получить файл как InputMediaPhoto для отправки в Telegram"""
+    async def _upload_stream(
+        self, s3_client: Client, key: str, file_data: FileData, content_type: str
+    ) -> None:
+        """
+        Загрузить поток в S3, держа в памяти не больше одной части
+
+        Поток не длиннее S3_PART_SIZE (обычная картинка) уходит одним
+        put_object, более длинный — multipart-загрузкой по частям.
+        """
+        buffer = bytearray()
+        upload_id = None
+        parts = []
         try:
-            # Пробуем найти файл с разными расширениями
-            for extension in ['jpg', 'jpeg', 'png', 'gif', 'webp']:
-                key = f"{file_id}.{extension}"
+            async for chunk in iter_chunks(file_data):
+                buffer += chunk
+                while len(buffer) >= S3_PART_SIZE:
+                    if upload_id is None:
+                        response = await s3_client.create_multipart_upload(
+                            Bucket=self.bucket_name, Key=key, ContentType=content_type
+                        )
+                        upload_id = response['UploadId']
+                    part = bytes(buffer[:S3_PART_SIZE])
+                    del buffer[:S3_PART_SIZE]
+                    parts.append(await self._upload_part(
+                        s3_client, key, upload_id, len(parts) + 1, part
+                    ))
+
+            if upload_id is None:
+                await s3_client.put_object(
+                    Bucket=self.bucket_name, Key=key, Body=bytes(buffer),
+                    ContentType=content_type
+                )
+                return
+
+            if buffer:
+                parts.append(await self._upload_part(
+                    s3_client, key, upload_id, len(parts) + 1, bytes(buffer)
+                ))
+            await s3_client.complete_multipart_upload(
+                Bucket=self.bucket_name, Key=key, UploadId=upload_id,
+                MultipartUpload={'Parts': parts}
+            )
+        except BaseException:
+            # Брошенная multipart-загрузка занимает место в bucket
+            if upload_id is not None:
                 try:
-                    # Генерируем временный URL для файла
-                    url = await self.get_file_url(file_id, expires_in=3600)
-                    if url:
-                        logfire.info("File retrieved from S3: {key}, url: {url}", key=key, url=url)
-                        return InputMediaPhoto(media=URLInputFile(url))
-                except Exception:
+                    await s3_client.abort_multipart_upload(
+                        Bucket=self.bucket_name, Key=key, UploadId=upload_id
+                    )
+                except Exception as e:
+                    logfire.warning(f"Error aborting multipart upload {key}: {e}")
+            raise
+    
+    async def _upload_part(
+        self, s3_client: Client, key: str, upload_id: str, part_number: int, body: bytes
+    ) -> dict:
+        """Загрузить одну часть multipart-загрузки"""
+        response = await s3_client.upload_part(
+            Bucket=self.bucket_name, Key=key, UploadId=upload_id,
+            PartNumber=part_number, Body=body
+        )
+        return {'ETag': response['ETag'], 'PartNumber': part_number}
+    
+    async def find_key(self, file_id: str) -> Optional[str]:
+        """Найти ключ существующего объекта (один head_object для полного ключа)"""
+        s3_client = await self._get_client()
+        for key in storage_keys(file_id):
+            try:
+                await s3_client.head_object(Bucket=self.bucket_name, Key=key)
+                return key
+            except ClientError as e:
+                if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
                     continue
-                            
-            logfire.warning(f"File not found in S3: {file_id}")
-            return None
-            
-        except Exception as e:
-            logfire.error(f"Error retrieving file from S3: {e}")
+                raise
+        return None
+    
+    async def read_file(self, file_id: str) -> Optional[bytes]:
+        """Скачать файл из S3"""
+        keys = storage_keys(file_id)
+        key = keys[0] if len(keys) == 1 else await self.find_key(file_id)
+        if not key:
             return None
+        s3_client = await self._get_client()
+        try:
+            response = await s3_client.get_object(Bucket=self.bucket_name, Key=key)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+        async with response['Body'] as stream:
+            return await stream.read()
+    
+    async def get_media_photo(self, file_id: str) -> Optional[InputMediaPhoto]:
+        """Получить файл как InputMediaPhoto для отправки в Telegram"""
+        url = await self.get_file_url(file_id, expires_in=3600)
+        if url:
+            return InputMediaPhoto(media=URLInputFile(url))
+        return None
     
     async def delete_file(self, file_id: str) -> bool:
         """Удалить файл из S3 по id"""
+        return await self.delete_files([file_id]) == 1
+    
+    async def delete_files(self, file_ids: List[str], concurrency: int = 10) -> int:
+        """Удалить несколько файлов из S3 пакетными запросами delete_objects"""
+        # Для id старого формата удаляем все возможные ключи,
+        # отсутствующие ключи S3 пропускает без ошибки
+        for file_id in file_ids:
+            self.url_cache.invalidate(file_id)
+        key_to_id = {
+            key: file_id for file_id in file_ids for key in storage_keys(file_id)
+        }
+        keys = list(key_to_id)
+        failed = set()
         try:
-            async with self.session.client(
-                's3',
-                endpoint_url=self.endpoint_url,
-                use_ssl=False
-            ) as s3_client:
-                s3_client: Client
-                # Пробуем удалить файл с разными расширениями
-                for extension in ['jpg', 'jpeg', 'png', 'gif', 'webp']:
-                    key = f"{file_id}.{extension}"
-                    try:
-                        await s3_client.delete_object(Bucket=self.bucket_name, Key=key)
-                        logfire.info(f"File deleted from S3: {key}")
-                        return True
-                    except ClientError as e:
-                        if e.response['Error']['Code'] == 'NoSuchKey':
-                            continue
-                        else:
-                            raise
-                            
-            logfire.warning(f"File not found for deletion in S3: {file_id}")
-            return False
-            
+            s3_client = await self._get_client()
+            # Не больше 1000 ключей в одном запросе
+            for start in range(0, len(keys), 1000):
+                response = await s3_client.delete_objects(
+                    Bucket=self.bucket_name,
+                    Delete={
+                        'Objects': [{'Key': key} for key in keys[start:start + 1000]],
+                        'Quiet': True,
+                    },
+                )
+                for error in response.get('Errors', []):
+                    logfire.error(f"Error deleting file from S3: {error.get('Key')}: {error.get('Message')}")
+                    failed.add(key_to_id.get(error.get('Key')))
         except Exception as e:
-            logfire.error(f"Error deleting file from S3: {e}")
-            return False
+            logfire.error(f"Error deleting files from S3: {e}")
+            return 0
+        deleted = len(set(file_ids) - failed)
+        logfire.info(f"Files deleted from S3: {deleted}")
+        return deleted
     
     async def get_file_url(self, file_id: str, expires_in: int = 3600) -> Optional[str]:
         """Получить URL файла для прямого доступа (с временной ссылкой)"""
+        cached = self.url_cache.get(file_id)
+        if cached:
+            return cached
         try:
-            async with self.session.client(
-                's3',
-                endpoint_url=self.endpoint_url,
-                use_ssl=False
-            ) as s3_client:
-                s3_client: Client
-                # Пробуем найти файл с разными расширениями
-                for extension in ['jpg', 'jpeg', 'png', 'gif', 'webp']:
-                    key = f"{file_id}.{extension}"
-                    try:
-                        # Проверяем существование файла
-                        await s3_client.head_object(Bucket=self.bucket_name, Key=key)
-                        
-                        # Генерируем временный URL
-                        url = await s3_client.generate_presigned_url(
-                            'get_object',
-                            Params={'Bucket': self.bucket_name, 'Key': key},
-                            ExpiresIn=expires_in
-                        )
-                        logfire.info("Generated presigned URL for: {key}, {url}", key=key, url=url)
-                        return url
-                    except ClientError as e:
-                        if e.response['Error']['Code'] == 'NoSuchKey':
-                            continue
-                        else:
-                            raise
-                            
-            logfire.warning(f"File not found for URL generation: {file_id}")
-            return None
+            key = await self.find_key(file_id)
+            if not key:
+                logfire.warning(f"File not found for URL generation: {file_id}")
+                return None
+            s3_client = await self._get_client()
+            url = await s3_client.generate_presigned_url(
+                'get_object',
+                Params={'Bucket': self.bucket_name, 'Key': key},
+                ExpiresIn=expires_in
+            )
+            logfire.info("Generated presigned URL for: {key}, {url}", key=key, url=url)
+            self.url_cache.put(file_id, url, expires_in)
+            return url
             
         except Exception as e:
             logfire.error(f"Error generating file URL: {e}")
@@ -175,13 +311,10 @@ class S3FileStorage(FileStorageInterface):
     async def test_connection(self) -> bool:
         """Тестировать подключение к S3"""
         try:
-            async with self.session.client(
-                's3',
-                endpoint_url=self.endpoint_url
-            ) as s3_client:
-                await s3_client.head_bucket(Bucket=self.bucket_name)
-                logfire.info("S3 connection test successful")
-                return True
+            s3_client = await self._get_client()
+            await s3_client.head_bucket(Bucket=self.bucket_name)
+            logfire.info("S3 connection test successful")
+            return True
         except Exception as e:
             logfire.error(f"S3 connection test failed: {e}")
             return False 
@@ -0,0 +1,70 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import logfire
+
+_hits_counter = logfire.metric_counter(
+    "storage.url_cache.hits", description="Ссылки на файлы, взятые из кэша"
+)
+_misses_counter = logfire.metric_counter(
+    "storage.url_cache.misses", description="Ссылки на файлы, сгенерированные заново"
+)
+
+
+class PresignedUrlCache:
+    """LRU-кэш временных ссылок на файлы хранилища
+
+    Ссылка вытесняется за margin секунд до истечения: за это время Telegram
+    успевает скачать картинку по выданной ссылке. При переполнении удаляются
+    давно не запрашиваемые ссылки. Кэш живет в памяти процесса.
+    """
+
+    def __init__(self, max_size: int = 1024, margin: float = 300):
+        self.max_size = max_size
+        self.margin = margin
+        # file_id -> (ссылка, момент, после которого ее нельзя выдавать)
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, file_id: str) -> Optional[str]:
+        """Ссылка из кэша или None, если ее нет или она скоро истечет"""
+        entry = self._entries.get(file_id)
+        if entry and entry[1] > time.monotonic():
+            self._entries.move_to_end(file_id)
+            self.hits += 1
+            _hits_counter.add(1)
+            return entry[0]
+        if entry:
+            del self._entries[file_id]
+            self.evictions += 1
+        self.misses += 1
+        _misses_counter.add(1)
+        return None
+
+    def put(self, file_id: str, url: str, expires_in: float) -> None:
+        """Запомнить ссылку, действующую expires_in секунд"""
+        if expires_in <= self.margin or self.max_size <= 0:
+            return
+        self._entries[file_id] = (url, time.monotonic() + expires_in - self.margin)
+        self._entries.move_to_end(file_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, file_id: str) -> None:
+        """Забыть ссылку (файл удален)"""
+        self._entries.pop(file_id, None)
+
+    def stats(self) -> Dict[str, float]:
+        """Размер кэша и счетчики попаданий"""
+        requests = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / requests if requests else 0.0,
+        }
@@ -8,10 +8,24 @@ from .category_utils import (
     get_clean_category_string,
     visual_len,
 )
+from .pagination import encode_cursor, decode_cursor, post_cursor
+from .fanout import FanoutEngine, FanoutStats, get_fanout_engine, share_fanout_rate
+from .background import run_in_background, cancel_background_tasks
+from .telegram import is_unreachable_chat
 
 __all__ = [
     "remove_emoji_from_category",
     "get_clean_category_names",
     "get_clean_category_string",
     "visual_len",
+    "encode_cursor",
+    "decode_cursor",
+    "post_cursor",
+    "FanoutEngine",
+    "FanoutStats",
+    "get_fanout_engine",
+    "share_fanout_rate",
+    "run_in_background",
+    "cancel_background_tasks",
+    "is_unreachable_chat",
 ]
@@ -0,0 +1,33 @@
+"""
+Фоновые задачи, запускаемые из обработчиков
+"""
+
+import asyncio
+from typing import Coroutine, Set
+
+import logfire
+
+# Ссылки на задачи, чтобы сборщик мусора не удалил их до завершения
+_background_tasks: Set[asyncio.Task] = set()
+
+
+def _on_task_done(task: asyncio.Task) -> None:
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logfire.error(f"Фоновая задача {task.get_name()} завершилась с ошибкой: {task.exception()!r}")
+
+
+def run_in_background(coro: Coroutine, name: str | None = None) -> asyncio.Task:
+    """Запустить корутину в фоне, не дожидаясь ее завершения"""
+    task = asyncio.create_task(coro, name=name)
+    _background_tasks.add(task)
+    task.add_done_callback(_on_task_done)
+    return task
+
+
+async def cancel_background_tasks() -> None:
+    """Отменить незавершенные фоновые задачи (при остановке бота)"""
+    tasks = list(_background_tasks)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,240 @@
+"""
+Рассылка сообщений множеству чатов с учетом лимитов Telegram
+"""
+
+import asyncio
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterable, Awaitable, Callable, Dict, Iterable, Optional, Union
+
+import logfire
+from aiogram.exceptions import TelegramRetryAfter
+
+
+class TokenBucket:
+    """Глобальный лимит отправки: не больше rate сообщений в секунду"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        """Остановить выдачу токенов (Telegram ответил RetryAfter)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self) -> None:
+        """Дождаться токена на отправку одного сообщения"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class ChatRateLimiter:
+    """Лимит на один чат: не чаще одного сообщения за interval секунд"""
+
+    # Сколько чатов помнить, прежде чем чистить устаревшие записи
+    MAX_TRACKED_CHATS = 10000
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._next_at: Dict[int, float] = {}
+
+    async def acquire(self, chat_id: int) -> None:
+        """Дождаться, когда в чат снова можно писать"""
+        now = time.monotonic()
+        ready_at = self._next_at.get(chat_id, 0.0)
+        self._next_at[chat_id] = max(now, ready_at) + self.interval
+        if len(self._next_at) > self.MAX_TRACKED_CHATS:
+            self._next_at = {
+                chat: at for chat, at in self._next_at.items() if at > now
+            }
+        if ready_at > now:
+            await asyncio.sleep(ready_at - now)
+
+
+@dataclass
+class FanoutStats:
+    """Прогресс рассылки"""
+
+    total: int = 0
+    sent: int = 0
+    failed: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def processed(self) -> int:
+        return self.sent + self.failed
+
+
+SendFunc = Callable[[Any], Awaitable[None]]
+ChatIdFunc = Callable[[Any], int]
+DoneFunc = Callable[[Any, Optional[Exception]], None]
+ProgressFunc = Callable[[FanoutStats], Awaitable[None]]
+
+
+class FanoutEngine:
+    """Рассылка пулом воркеров с глобальным и початовым лимитами
+
+    Один экземпляр на процесс (get_fanout_engine), чтобы все рассылки
+    делили общий лимит Telegram.
+    """
+
+    def __init__(
+        self,
+        rate: float = 30,
+        chat_interval: float = 1.0,
+        workers: int = 16,
+        max_retries: int = 3,
+        progress_interval: float = 5.0,
+    ):
+        self.bucket = TokenBucket(rate)
+        self.chat_limiter = ChatRateLimiter(chat_interval)
+        self.workers = workers
+        self.max_retries = max_retries
+        self.progress_interval = progress_interval
+
+    async def _deliver(
+        self,
+        item: Any,
+        chat_id: int,
+        send: SendFunc,
+        stats: FanoutStats,
+        on_done: Optional[DoneFunc] = None,
+    ) -> None:
+        """Отправить одно сообщение с повтором после RetryAfter"""
+        error: Optional[Exception] = None
+        for _ in range(self.max_retries + 1):
+            await self.chat_limiter.acquire(chat_id)
+            await self.bucket.acquire()
+            try:
+                await send(item)
+                error = None
+                break
+            except TelegramRetryAfter as e:
+                logfire.warning(
+                    f"Лимит Telegram при отправке в чат {chat_id}, пауза {e.retry_after} с"
+                )
+                self.bucket.pause(e.retry_after)
+                error = e
+            except Exception as e:
+                logfire.warning(f"Ошибка отправки в чат {chat_id}: {e}")
+                error = e
+                break
+        if error is None:
+            stats.sent += 1
+        else:
+            stats.failed += 1
+        if on_done:
+            on_done(item, error)
+
+    async def _report(self, stats: FanoutStats, on_progress: ProgressFunc) -> None:
+        """Периодически сообщать о прогрессе"""
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            try:
+                await on_progress(stats)
+            except Exception as e:
+                logfire.warning(f"Не удалось обновить прогресс рассылки: {e}")
+
+    async def run(
+        self,
+        items: Union[Iterable[Any], AsyncIterable[Any]],
+        send: SendFunc,
+        total: Optional[int] = None,
+        on_progress: Optional[ProgressFunc] = None,
+        chat_id_of: Optional[ChatIdFunc] = None,
+        on_done: Optional[DoneFunc] = None,
+    ) -> FanoutStats:
+        """Разослать сообщение получателям, вызывая send(item) для каждого
+
+        items — id чатов или любые записи о получателях; во втором случае
+        chat_id_of(item) возвращает id чата для початового лимита.
+        on_done(item, error) вызывается по итогу каждой отправки
+        (error равен None при успехе).
+        """
+        if total is None and hasattr(items, "__len__"):
+            total = len(items)
+        stats = FanoutStats(total=total or 0)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.workers * 2)
+
+        async def worker() -> None:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                chat_id = chat_id_of(item) if chat_id_of else item
+                await self._deliver(item, chat_id, send, stats, on_done)
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.workers)]
+        reporter = (
+            asyncio.create_task(self._report(stats, on_progress)) if on_progress else None
+        )
+        try:
+            if hasattr(items, "__aiter__"):
+                async for item in items:
+                    await queue.put(item)
+            else:
+                for item in items:
+                    await queue.put(item)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            if reporter:
+                reporter.cancel()
+
+        if total is None:
+            stats.total = stats.processed
+        if on_progress:
+            try:
+                await on_progress(stats)
+            except Exception as e:
+                logfire.warning(f"Не удалось обновить прогресс рассылки: {e}")
+        return stats
+
+
+_engine: Optional[FanoutEngine] = None
+# Сколько процессов бота делят общий лимит FANOUT_RATE
+_rate_share = 1
+
+
+def share_fanout_rate(processes: int) -> None:
+    """Разделить лимит FANOUT_RATE поровну между processes процессами
+
+    Лимит Telegram общий на бота, а очередь отправки у каждого процесса
+    своя. Вызывается до первой рассылки процесса.
+    """
+    global _engine, _rate_share
+    _rate_share = max(1, processes)
+    _engine = None
+
+
+def get_fanout_engine() -> FanoutEngine:
+    """Общий движок рассылки процесса (лимиты из переменных окружения)"""
+    global _engine
+    if _engine is None:
+        _engine = FanoutEngine(
+            rate=float(os.getenv("FANOUT_RATE", "30")) / _rate_share,
+            chat_interval=float(os.getenv("FANOUT_CHAT_INTERVAL", "1.0")),
+            workers=int(os.getenv("FANOUT_WORKERS", "16")),
+            progress_interval=float(os.getenv("FANOUT_PROGRESS_INTERVAL", "5")),
+        )
+    return _engine
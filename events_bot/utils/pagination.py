@@ -0,0 +1,56 @@
+"""
+Курсоры для keyset-пагинации ленты по ключу (event_at, id)
+"""
+
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+_EPOCH = datetime(1970, 1, 1)
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+# Маркер поста без даты события (такие посты идут в конце ленты)
+_NO_DATE = "n"
+
+
+def _to_base36(value: int) -> str:
+    if value < 0:
+        return "-" + _to_base36(-value)
+    digits = []
+    while True:
+        value, rem = divmod(value, 36)
+        digits.append(_DIGITS[rem])
+        if not value:
+            return "".join(reversed(digits))
+
+
+def encode_cursor(event_at: Optional[datetime], post_id: int) -> str:
+    """Кодирует позицию поста в короткую строку для callback_data
+
+    Строка не содержит символа «_», поэтому ее можно класть в callback_data
+    с разделителями «_». Длина — не более ~20 символов, что укладывается
+    в лимит Telegram в 64 байта вместе с остальными полями кнопки.
+    """
+    if event_at is None:
+        event_part = _NO_DATE
+    else:
+        event_part = _to_base36((event_at.replace(tzinfo=None) - _EPOCH) // timedelta(microseconds=1))
+    return f"{event_part}.{_to_base36(post_id)}"
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    """Декодирует курсор обратно в (event_at, id)
+
+    Raises:
+        ValueError: если строка не является курсором
+    """
+    event_part, sep, id_part = cursor.partition(".")
+    if not sep or not event_part or not id_part:
+        raise ValueError(f"Некорректный курсор: {cursor!r}")
+    event_at = None
+    if event_part != _NO_DATE:
+        event_at = _EPOCH + timedelta(microseconds=int(event_part, 36))
+    return event_at, int(id_part, 36)
+
+
+def post_cursor(post) -> str:
+    """Курсор для ORM-объекта поста"""
+    return encode_cursor(getattr(post, "event_at", None), post.id)
@@ -1,5 +1,5 @@
 from aiogram.types import Message
-from aiogram.exceptions import TelegramBadRequest
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
 import logfire
 
 
@@ -24,3 +24,15 @@ async def safe_edit_message(message: Message, text: str, reply_markup=None, pars
             logfire.error(f"TelegramBadRequest при редактировании сообщения: {e}")
     except Exception as e:
         logfire.error(f"Ошибка при редактировании сообщения: {e}")
+
+
+def is_unreachable_chat(error: Exception) -> bool:
+    """
+    Ошибка означает, что писать в чат больше нельзя:
+    бот заблокирован, пользователь удален или чат не найден
+    """
+    if isinstance(error, TelegramForbiddenError):
+        return True
+    if isinstance(error, TelegramBadRequest):
+        return "chat not found" in str(error).lower()
+    return False
@@ -14,23 +14,30 @@ except Exception:
 import asyncio
 import os
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
-from events_bot.database import init_database
-from events_bot.bot.handlers import (
-    register_start_handlers,
-    register_user_handlers,
-    register_post_handlers,
-    register_callback_handlers,
-    register_moderation_handlers,
-    register_feed_handlers,
-)
-from events_bot.bot.middleware import DatabaseMiddleware
-from events_bot.database.services.post_service import PostService
+from events_bot.database import init_database, init_engine, dispose_engine
+from events_bot.bot.app import create_dispatcher, run_background_tasks
+from events_bot.bot.fsm_storage import get_fsm_storage
+from events_bot.bot.sharding import run_sharded
+from events_bot.bot.webhook import run_webhook
+from events_bot.storage import file_storage
+from events_bot.utils import cancel_background_tasks
 from loguru import logger
 
 logger.configure(handlers=[logfire.loguru_handler()])
 
 
+async def receive_updates(dp: Dispatcher, bot: Bot) -> None:
+    """Получать обновления до остановки бота: long polling или webhook"""
+    if os.getenv("BOT_MODE", "polling").lower() == "webhook":
+        await run_webhook(dp, bot)
+    else:
+        # Обновления обрабатываются по одному только в многопроцессном
+        # режиме, где их лишь раскладывают по воркерам с сохранением порядка
+        await dp.start_polling(
+            bot, handle_as_tasks=int(os.getenv("BOT_WORKERS", "1")) <= 1
+        )
+
+
 async def main() -> None:
     """Главная функция бота"""
     # Подхват переменных окружения из .env, если есть
@@ -55,66 +62,43 @@ async def main() -> None:
         )
         return
 
-    # Инициализируем базу данных
+    # Создаем общий пул соединений и инициализируем базу данных
+    init_engine()
     await init_database()
     logfire.info("✅ Database initialized")
 
-    # Создаем бота и диспетчер
-    bot = Bot(token=token)
-    storage = MemoryStorage()
-    dp = Dispatcher(storage=storage)
+    workers = int(os.getenv("BOT_WORKERS", "1"))
+    if workers > 1:
+        # Этот процесс только принимает обновления; база нужна воркерам
+        await dispose_engine()
+        await run_sharded(token, workers, receive_updates)
+        logfire.info("🛑 Bot stopped")
+        return
 
-    # Подключаем middleware для базы данных
-    dp.message.middleware(DatabaseMiddleware())
-    dp.callback_query.middleware(DatabaseMiddleware())
+    # Долгоживущий клиент файлового хранилища
+    await file_storage.start()
 
-    # Регистрируем обработчики
-    register_start_handlers(dp)
-    register_user_handlers(dp)
-    register_post_handlers(dp)
-    register_callback_handlers(dp)
-    register_moderation_handlers(dp)
-    register_feed_handlers(dp)
+    # Создаем бота и диспетчер
+    bot = Bot(token=token)
+    # Состояния FSM переживают перезапуск и общие для всех процессов бота
+    storage = get_fsm_storage()
+    dp = create_dispatcher(storage)
 
     logfire.info("🤖 Bot started...")
 
-    async def cleanup_expired_posts_task() -> None:
-        from events_bot.bot.utils import get_db_session
-        from events_bot.storage import file_storage
-
-        while True:
-            try:
-                async with get_db_session() as db:
-                    # Сначала собираем информацию о просроченных постах
-                    # (id, image_id)
-                    expired = await PostService.get_expired_posts_info(db)
-                    deleted = await PostService.delete_expired_posts(db)
-                    if deleted:
-                        logfire.info(
-                            f"🧹 Удалено просроченных постов: {deleted}"
-                        )
-                        # Удаляем связанные файлы из хранилища
-                        for row in expired:
-                            image_id = row.get("image_id")
-                            if image_id:
-                                try:
-                                    await file_storage.delete_file(image_id)
-                                except Exception:
-                                    pass
-            except Exception as e:
-                logfire.error(f"Ошибка фоновой очистки постов: {e}")
-            await asyncio.sleep(60 * 10)
-
+    # Фоновые задачи работают, пока бот принимает обновления
+    background = asyncio.create_task(run_background_tasks(bot, storage))
     try:
-        # Запускаем бота и фоновую очистку одновременно
-        await asyncio.gather(
-            dp.start_polling(bot),
-            cleanup_expired_posts_task(),
-        )
-    except KeyboardInterrupt:
+        await receive_updates(dp, bot)
         logfire.info("🛑 Bot stopped")
     finally:
+        background.cancel()
+        await asyncio.gather(background, return_exceptions=True)
+        await cancel_background_tasks()
         await bot.session.close()
+        await storage.close()
+        await file_storage.close()
+        await dispose_engine()
 
 
 if __name__ == "__main__":